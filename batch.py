@@ -0,0 +1,271 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Batched TEBD: many simulations that share L, d, chi and the time step,
+# e.g. the points of a sweep over U or J, evolved together.
+#
+# Every tensor of helpers.TEBD gets a leading batch axis, so the
+# contractions and SVDs of a bond are done for all members in one stacked
+# NumPy call instead of a Python loop of small calls per member, which
+# is what the time goes to at small chi. The gates of each member are
+# built by helpers.Operators (through gates.Cached_Operators).
+#
+# A bond has the largest bond dimension that any member needs;
+# members that need fewer Schmidt values carry zeros in the rest,
+# so every member is truncated exactly as helpers.TEBD truncates it.
+#
+# Supports real-time evolution with the Trotter schedules of helpers.py
+# (and sim['fuse']), logging of rho, a, n, n2 and E, and the truncation
+# error of each member (the bond energies are all measured on the
+# truncated state, where helpers.TEBD takes those of the last layer from
+# just before the truncation). Not supported: sim['sym'], ground states
+# (sim['it']), ramps (model['ramp']), streaming (logs['out']) and
+# checkpoints; those runs need
+# helpers.TEBD.
+#
+# The logged arrays have the member as their first axis,
+# e.g. n_avg[member, site, t], like the tables of sweep.Run_Sweep;
+# sweep.Run_Sweep(..., batch=True) runs the points with the same sim together.
+
+import numpy as np
+import helpers
+import gates
+import sweep
+
+class Batch_TEBD(object):
+	# One member per (model, init) pair; all share sim and logs
+	def __init__(self, models, sim, inits, logs):
+		for name in ['sym', 'it', 'checkpoint']:
+			if (sim.get(name)):
+				raise ValueError("batched runs do not support sim['{0}']".format(name))
+		if (logs.get('out')):
+			raise ValueError("batched runs do not support logs['out']")
+		if (any([model.get('ramp') for model in models])):
+			raise ValueError("batched runs do not support model['ramp']")
+		self.models = models
+		self.sim = sim
+		self.inits = inits
+		self.logs = logs
+		self.B = B = len(models)
+		L = sim['L']; d = sim['d']
+		cdtype, rdtype = helpers.Dtypes(sim)
+
+		# Product initial states: every bond dimension is 1
+		coeffs = np.array([helpers.Initialize_States(sim, init) for init in inits])
+		self.tensorA = [np.reshape(coeffs[:, l, :], (B, d, 1, 1)).astype(cdtype) for l in range(0, L)]
+		self.Lambda = [np.ones((B, 1), dtype=rdtype) for l in range(0, L-1)]
+		self.tau = np.zeros(B)
+		self.step = 0
+
+		T = sim['N'] // (logs['skip'] + 1) + 1
+		self.rhos = np.zeros((B, L, T if logs['rho'] else 0, d, d), dtype=cdtype)
+		self.a_avg = np.zeros((B, L, T if logs['a'] else 0), dtype=cdtype)
+		self.n_avg = np.zeros((B, L, T if logs['n'] else 0))
+		self.n2_avg = np.zeros((B, L, T if logs.get('n2', False) else 0))
+		self.E_bond = np.zeros((B, L-1, T if logs.get('E', False) else 0))
+
+	# The simulation loop, as helpers.TEBD.Run_Simulation
+	def Run_Simulation(self):
+		N = self.sim['N']
+		logs = self.logs
+		self.ops = [gates.Cached_Operators(helpers.Operators, model, self.sim) for model in self.models]
+		self.Measure(0)
+
+		schedule = helpers.Schedule(self.sim)
+		layers = [self.Layer(parity, frac) for (parity, frac) in schedule]
+		fuse = self.sim.get('fuse', False) and (schedule[0][0] == schedule[-1][0])
+		if (fuse):
+			fused = self.Layer(schedule[-1][0], schedule[-1][1] + schedule[0][1])
+		split = True
+
+		for i in range(self.step+1, N+1):
+			if (split):
+				self.Update_Layer(layers[0])
+			for layer in layers[1:-1]:
+				self.Update_Layer(layer)
+			split = (not fuse) or (i % (logs['skip'] + 1) == 0) or (i == N)
+			if (split):
+				self.Update_Layer(layers[-1])
+			else:
+				self.Update_Layer(fused)
+
+			if (i % (logs['skip'] + 1) == 0):
+				self.Measure(i // (logs['skip'] + 1))
+			self.step = i
+
+	# Gates [(V, l), ...] of all members on every odd (parity = 1) or
+	# even (parity = 0) bond, V[member] a (d*d x d*d) matrix
+	def Layer(self, parity, frac):
+		d = self.sim['d']
+		layer = []
+		for l in range(parity, self.sim['L'] - 1, 2):
+			V = np.array([ops.Gate(ops.Bond_Kind(l), frac) for ops in self.ops])
+			layer.append((np.reshape(V, (self.B, d*d, d*d)), l))
+		return layer
+
+	def Update_Layer(self, layer):
+		for (V, l) in layer:
+			self.Update(V, l)
+
+	# Apply the gates V to bond l of every member and split again,
+	# as helpers.Evolve_Bond does for one member
+	def Update(self, V, l):
+		sim = self.sim
+		d = sim['d']; B = self.B
+		rdtype = helpers.Dtypes(sim)[1]
+		Theta = self.Theta(l)
+		chi_l = Theta.shape[3]; chi_r = Theta.shape[4]
+		# Theta[b, s, t, a, c]: apply V[b] to the physical indices (s, t)
+		Theta = np.reshape(np.matmul(V, np.reshape(Theta, (B, d*d, chi_l*chi_r))), (B, d, d, chi_l, chi_r))
+
+		# Phi = Theta * Lambda_(l+1), normalized as in helpers.Evolve_Bond
+		if (l != sim['L'] - 2):
+			Phi = Theta * self.Lambda[l+1][:, None, None, None, :]
+		else:
+			Phi = Theta
+		norm = np.sqrt(np.sum(np.absolute(Phi)**2, axis=(1,2,3,4)))
+		Phi = Phi / norm[:, None, None, None, None]
+		Theta = Theta / norm[:, None, None, None, None]
+		# Rows (s, a), columns (t, c), and one SVD per member in a single call
+		Phi = np.reshape(np.transpose(Phi, (0,1,3,2,4)), (B, d*chi_l, d*chi_r))
+		U, S, Vh = np.linalg.svd(Phi, full_matrices=False)
+
+		# Bond dimension of each member (as in helpers.Evolve_Bond),
+		# and of the batch: the largest of them
+		chis = helpers.Bond_Dimensions(S, sim)
+		chi = int(np.max(chis))
+		keep = (np.arange(chi)[None, :] < chis[:, None])
+
+		# Truncation error of each member
+		weights = np.absolute(S).astype(np.float64)**2
+		total = np.sum(weights, axis=1)
+		kept = np.sum(weights[:, 0:chi] * keep, axis=1)
+		self.tau += sim['delta'] * (total - kept) / total
+
+		# Schmidt values beyond a member's own bond dimension are zero,
+		# and so are the columns of A_l that go with them
+		Lambda_l = S[:, 0:chi] * keep
+		Lambda_l = Lambda_l / np.sqrt(np.sum(Lambda_l**2, axis=1))[:, None]
+		self.Lambda[l] = Lambda_l.astype(rdtype)
+		A_l = U[:, :, 0:chi] * keep[:, None, :]
+		A_l = np.reshape(A_l, (B, d, chi_l, chi))
+		self.tensorA[l] = A_l
+
+		# A_(l+1) = A_l^dag Theta (Urbanek and Soldan eq. 19)
+		A_l_dag = np.conjugate(np.transpose(np.reshape(A_l, (B, d*chi_l, chi)), (0,2,1)))
+		Theta = np.reshape(np.transpose(Theta, (0,1,3,2,4)), (B, d*chi_l, d*chi_r))
+		A_lp1 = np.reshape(np.matmul(A_l_dag, Theta), (B, chi, d, chi_r))
+		self.tensorA[l+1] = np.transpose(A_lp1, (0,2,1,3))
+
+	# Theta[b, s, t, a, c] = A_l[b, s, a, m] A_(l+1)[b, t, m, c]
+	def Theta(self, l):
+		A_l = self.tensorA[l]; A_lp1 = self.tensorA[l+1]
+		B, d, chi_l, chi = A_l.shape
+		chi_r = A_lp1.shape[3]
+		left = np.reshape(A_l, (B, d*chi_l, chi))
+		right = np.reshape(np.transpose(A_lp1, (0,2,1,3)), (B, chi, d*chi_r))
+		Theta = np.reshape(np.matmul(left, right), (B, d, chi_l, d, chi_r))
+		return np.transpose(Theta, (0,1,3,2,4))
+
+	# Squared Schmidt values on the bond to the right of site k
+	def Right_Weights(self, k):
+		if (k != self.sim['L'] - 1):
+			return np.absolute(self.Lambda[k])**2
+		else:
+			return np.ones((self.B, 1))
+
+	# Reduced density matrices of all sites of all members, (B, L, d, d)
+	def Site_Rhos(self):
+		L = self.sim['L']; d = self.sim['d']
+		rhos = np.zeros((self.B, L, d, d), dtype=helpers.Dtypes(self.sim)[0])
+		for k in range(0, L):
+			A_k = self.tensorA[k]
+			rhos[:, k] = np.einsum('bsac,btac,bc->bst', A_k, np.conjugate(A_k), self.Right_Weights(k))
+		return rhos
+
+	# Energy of every bond of every member, (B, L-1)
+	def Bond_Energies(self):
+		L = self.sim['L']; d = self.sim['d']; B = self.B
+		energies = np.zeros((B, L-1))
+		for l in range(0, L-1):
+			Phi = self.Theta(l)
+			if (l != L - 2):
+				Phi = Phi * self.Lambda[l+1][:, None, None, None, :]
+			Phi = np.reshape(Phi, (B, d*d, -1))
+			H = np.array([ops.H[ops.Bond_Kind(l)] for ops in self.ops])
+			H_Phi = np.matmul(H, Phi)
+			energies[:, l] = np.real(np.sum(np.conjugate(Phi) * H_Phi, axis=(1,2))) / np.sum(np.absolute(Phi)**2, axis=(1,2))
+		return energies
+
+	# Log everything requested in self.logs at time index ind
+	def Measure(self, ind):
+		logs = self.logs
+		ops = self.ops[0]
+		rhos = self.Site_Rhos()
+		if (logs['rho']):
+			self.rhos[:, :, ind] = rhos
+		if (logs['a']):
+			self.a_avg[:, :, ind] = np.einsum('bkst,ts->bk', rhos, ops.a)
+		if (logs['n']):
+			self.n_avg[:, :, ind] = np.real(np.einsum('bkst,ts->bk', rhos, ops.n_op))
+		if (logs.get('n2', False)):
+			self.n2_avg[:, :, ind] = np.real(np.einsum('bkst,ts->bk', rhos, np.dot(ops.n_op, ops.n_op)))
+		if (logs.get('E', False)):
+			self.E_bond[:, :, ind] = self.Bond_Energies()
+			self.energy = np.sum(self.E_bond[:, :, ind], axis=1)
+			if (ind == 0):
+				self.E0 = self.energy
+
+	# The results of member b, with the attributes of a helpers.TEBD
+	# (tau, E0, energy and the logged arrays), e.g. for sweep.Write_Point
+	def Member(self, b):
+		return Member(self, b)
+
+# View of one member of a Batch_TEBD
+class Member(object):
+	def __init__(self, batch, b):
+		self.batch = batch
+		self.b = b
+
+	def __getattr__(self, name):
+		return getattr(self.batch, name)[self.b]
+
+# Run the jobs of sweep.Run_Sweep (module 'helpers') with one Batch_TEBD
+# for each group of points that share sim, spread over a pool of workers;
+# returns the results of sweep.Run_Point, in the order of the jobs
+def Run_Points(jobs, pool=None):
+	groups = {}
+	for i in range(0, len(jobs)):
+		module, model, sim, init, logs, fields, name, resume = jobs[i]
+		if (module != 'helpers'):
+			raise ValueError("batched runs need module 'helpers'")
+		groups.setdefault(gates.Freeze(sim), []).append(i)
+	groups = list(groups.values())
+	if (pool is not None):
+		results = pool.map(Run_Group, [[jobs[i] for i in group] for group in groups], chunksize=1)
+	else:
+		results = [Run_Group([jobs[i] for i in group]) for group in groups]
+
+	ordered = [None] * len(jobs)
+	for (group, group_results) in zip(groups, results):
+		for (i, result) in zip(group, group_results):
+			ordered[i] = result
+	return ordered
+
+# Run jobs that share sim as one batch; this is what the workers execute
+def Run_Group(jobs):
+	models = [job[1] for job in jobs]
+	inits = [job[3] for job in jobs]
+	sim = jobs[0][2]; logs = jobs[0][4]
+	simulation = Batch_TEBD(models, sim, inits, logs)
+	simulation.Run_Simulation()
+
+	results = []
+	for b in range(0, len(jobs)):
+		module, model, sim, init, logs, fields, name, resume = jobs[b]
+		member = simulation.Member(b)
+		sweep.Write_Point(name, model, sim, init, logs, member)
+		result = {'tau': member.tau}
+		for field in fields:
+			result[field] = getattr(member, field)
+		results.append(result)
+	return results
@@ -0,0 +1,210 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Benchmarks of the TEBD kernels.
+#
+# Times TEBD.Update (one bond in the bulk), Build_Theta, Single_Site_Rho
+# (a site in the bulk), building the Operators (no gate cache) and whole
+# iterations of Run_Simulation, for helpers.py and helpers_2species.py,
+# on a grid of L, chi and d. Every time is in seconds per call, the best
+# of several repeats (as in timeit), so other load on the machine
+# only makes the numbers noisier, not systematically slower.
+#
+# helpers.TEBD starts from a random state whose bonds are all as large
+# as chi allows; helpers_2species.TEBD always works with chi x chi
+# tensors, so its product initial state costs the same.
+#
+# Each run is appended to a JSON file (benchmarks.json by default)
+# together with the commit it ran on, to follow the numbers across commits:
+#	python benchmarks.py			the full grid
+#	python benchmarks.py --quick		a small grid, e.g. before a commit
+#	python benchmarks.py --compare		the last two runs side by side
+# --compare exits with status 1 if any kernel got slower by more
+# than --threshold (default 1.25), so it can gate a build.
+
+import numpy as np
+import timeit
+import time
+import json
+import os
+import sys
+import platform
+import subprocess
+import argparse
+import helpers
+import helpers_2species
+
+# Grids of (L, chi, d); for helpers_2species d = da * db with db = 2
+grids = {'full': {'L': [10, 40], 'chi': [16, 64], 'd': [3, 5]},
+	'quick': {'L': [10], 'chi': [16], 'd': [3]}}
+
+# Iterations of Run_Simulation per timing
+steps = 5
+
+# Best time per call of f, over repeat rounds of number calls
+def Best_Time(f, repeat=5, number=1):
+	return min(timeit.Timer(f).repeat(repeat, number)) / number
+
+# Random MPS for helpers.TEBD.Set_State: every bond as large as chi
+# allows (chi, or the dimension of the smaller side of the chain)
+def Random_State(sim, seed=0):
+	L = sim['L']; d = sim['d']; chi = sim['chi']
+	rng = np.random.RandomState(seed)
+	dims = [min(chi, d**(l+1), d**(L-l-1)) for l in range(0, L-1)]
+	dims = [1] + dims + [1]
+	tensors = []
+	for l in range(0, L):
+		shape = (d, dims[l], dims[l+1])
+		tensors.append(rng.randn(*shape) + 1j * rng.randn(*shape))
+	return tensors
+
+# Parameters of helpers.TEBD
+def Parameters(L, chi, d):
+	model = {'J': 1.0, 'U': 2.0}
+	sim = {'d': d, 'chi': chi, 'L': L, 'delta': 0.01, 'N': steps}
+	init = {'nbar': 1.0, 'flag': 1, 'site': 1}
+	logs = {'rho': False, 'a': False, 'n': True, 'skip': 0}
+	return model, sim, init, logs
+
+# Parameters of helpers_2species.TEBD
+def Parameters_2species(L, chi, da):
+	model = {'Ja': 1.0, 'Ua': 2.0, 'Jb': 1.0, 'Uab': 1.0}
+	sim = {'da': da, 'db': 2, 'chi': chi, 'L': L, 'delta': 0.01, 'N': steps, 'it': False, 'mu': 0.5}
+	sim['d'] = sim['da'] * sim['db']
+	init = {'nbar': 1.0, 'flag': 1, 'site': 1}
+	logs = {'rho': False, 'a': False, 'b': False, 'na': True, 'nb': False, 'aa': False, 'skip': 0}
+	return model, sim, init, logs
+
+# Times of the kernels of helpers.TEBD, {kernel: seconds}
+def Time_helpers(L, chi, d):
+	model, sim, init, logs = Parameters(L, chi, d)
+	state = Random_State(sim)
+	simulation = helpers.TEBD(model, sim, init, logs)
+	simulation.Set_State(state)
+	ops = helpers.Operators(model, sim)
+	l = L // 2 - 1
+	V = ops.Gate(ops.Bond_Kind(l), 1)
+
+	times = {}
+	times['Operators'] = Best_Time(lambda: helpers.Operators(model, sim))
+	times['Build_Theta'] = Best_Time(lambda: simulation.Build_Theta(l), number=10)
+	times['Update'] = Best_Time(lambda: simulation.Update(V, l), number=10)
+	times['Single_Site_Rho'] = Best_Time(lambda: simulation.Single_Site_Rho(L // 2), number=10)
+
+	# Whole iterations, without building the simulation
+	def Run():
+		simulation = helpers.TEBD(model, sim, init, logs)
+		simulation.Set_State(state)
+		start = timeit.default_timer()
+		simulation.Run_Simulation()
+		return timeit.default_timer() - start
+	times['step'] = min([Run() for i in range(0, 3)]) / steps
+	return times
+
+# Times of the kernels of helpers_2species.TEBD, {kernel: seconds}
+def Time_helpers_2species(L, chi, da):
+	model, sim, init, logs = Parameters_2species(L, chi, da)
+	simulation = helpers_2species.TEBD(model, sim, init, logs)
+	ops = helpers_2species.Operators(model, sim)
+	l = L // 2 - 1
+
+	times = {}
+	times['Operators'] = Best_Time(lambda: helpers_2species.Operators(model, sim))
+	times['Build_Theta'] = Best_Time(lambda: simulation.Build_Theta(l), number=10)
+	times['Update'] = Best_Time(lambda: simulation.Update(ops.V_even, l), number=10)
+	times['Single_Site_Rho'] = Best_Time(lambda: simulation.Single_Site_Rho(L // 2), number=10)
+
+	def Run():
+		simulation = helpers_2species.TEBD(model, sim, init, logs)
+		start = timeit.default_timer()
+		simulation.Run_Simulation()
+		return timeit.default_timer() - start
+	times['step'] = min([Run() for i in range(0, 3)]) / steps
+	return times
+
+# Run the grid; returns a list of records
+# {'module', 'kernel', 'L', 'chi', 'd', 'time'}
+def Run_Benchmarks(grid):
+	results = []
+	for L in grid['L']:
+		for chi in grid['chi']:
+			for d in grid['d']:
+				for (module, timer, dim) in [('helpers', Time_helpers, d), ('helpers_2species', Time_helpers_2species, 2 * d)]:
+					times = timer(L, chi, d)
+					for kernel in sorted(times):
+						results.append({'module': module, 'kernel': kernel,
+							'L': L, 'chi': chi, 'd': dim, 'time': times[kernel]})
+						print "{0:17s} {1:16s} L = {2:3d} chi = {3:3d} d = {4:2d}: {5:.3e} s".format(
+							module, kernel, L, chi, dim, times[kernel])
+	return results
+
+# Commit of the working tree, and whether it has uncommitted changes
+# (None, None outside of a git repository)
+def Commit():
+	path = os.path.dirname(os.path.abspath(__file__))
+	try:
+		with open(os.devnull, 'w') as null:
+			commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path, stderr=null).strip()
+			status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=path, stderr=null)
+	except (OSError, subprocess.CalledProcessError):
+		return None, None
+	return commit, len(status.strip()) != 0
+
+# All runs in the JSON file (an empty list if there is none yet)
+def Load_Runs(filename):
+	if (not os.path.exists(filename)):
+		return []
+	with open(filename) as f:
+		return json.load(f)
+
+# Append a run to the JSON file
+def Save_Run(filename, run):
+	runs = Load_Runs(filename)
+	runs.append(run)
+	tmp = filename + ".tmp"
+	with open(tmp, 'w') as f:
+		json.dump(runs, f, indent=1, sort_keys=True)
+	os.rename(tmp, filename)
+
+# Print the ratios new/old of the times both runs have;
+# returns the number of kernels slower by more than threshold
+def Compare(old, new, threshold):
+	def Key(r):
+		return (r['module'], r['kernel'], r['L'], r['chi'], r['d'])
+	before = dict([(Key(r), r['time']) for r in old['results']])
+	print "{0} -> {1}".format(old['commit'], new['commit'])
+	slower = 0
+	for r in new['results']:
+		if (Key(r) not in before):
+			continue
+		ratio = r['time'] / before[Key(r)]
+		flag = ""
+		if (ratio > threshold):
+			flag = "  SLOWER"
+			slower += 1
+		print "{0:17s} {1:16s} L = {2:3d} chi = {3:3d} d = {4:2d}: {5:.3e} -> {6:.3e} s ({7:.2f}x){8}".format(
+			r['module'], r['kernel'], r['L'], r['chi'], r['d'], before[Key(r)], r['time'], ratio, flag)
+	return slower
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Benchmarks of the TEBD kernels")
+	parser.add_argument('--quick', action='store_true', help="run the small grid")
+	parser.add_argument('--out', default='benchmarks.json', help="JSON file of the runs")
+	parser.add_argument('--compare', action='store_true', help="compare the last two runs instead")
+	parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio to report")
+	args = parser.parse_args()
+
+	if (args.compare):
+		runs = Load_Runs(args.out)
+		if (len(runs) < 2):
+			print "need two runs in {0} to compare".format(args.out)
+			sys.exit(0)
+		sys.exit(1 if Compare(runs[-2], runs[-1], args.threshold) > 0 else 0)
+
+	grid = 'quick' if args.quick else 'full'
+	commit, dirty = Commit()
+	run = {'commit': commit, 'dirty': dirty, 'grid': grid,
+		'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+		'machine': platform.node(), 'processor': platform.processor(),
+		'python': platform.python_version(), 'numpy': np.__version__,
+		'results': Run_Benchmarks(grids[grid])}
+	Save_Run(args.out, run)
@@ -0,0 +1,141 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Store of finished sweep points, so that running the same point again
+# (e.g. in a later sweep that overlaps an earlier one) loads its results
+# instead of recomputing them.
+#
+# With sim['result_cache'] set to a directory, sweep.Run_Point looks every
+# point up before running it. Entries are keyed by a hash of everything the
+# result depends on: the module, the model, sim, init and logs dicts (less
+# the settings that only change how a run is done, see Ignored) and the
+# source of the simulation code, so entries of older code are never used.
+# An entry is the checkpoint of the finished run (TEBD.Save_Checkpoint:
+# the final MPS, tau and every logged array, e.g. a_avg, n_avg, rhos) and a
+# small JSON file with the parameters, N and the scalar results:
+#	<result_cache>/<hash>/N_<N>.npz, N_<N>.json
+#
+# The number of iterations N is not part of the key for time evolution:
+# a point asked for with a larger N than the cache holds continues from
+# the longest shorter run (TEBD.Load_Checkpoint) and only computes the
+# missing iterations. Ground states (sim['it']) are only reused for the
+# same N. Streamed runs (logs['out']), helpers_2species, ramps given
+# as functions and unseeded random initial states are never cached; nor
+# are the runs of batch.py, though batched sweeps still take the points
+# the cache has complete from it.
+#
+# Nothing is ever deleted; remove the directory to start over.
+
+import numpy as np
+import os
+import glob
+import json
+import hashlib
+import datetime
+import helpers
+
+# Settings of sim and logs that do not change the result of a run
+Ignored = {'sim': ['checkpoint', 'checkpoint_every', 'checkpoint_time', 'workers', 'pool',
+	'blas_threads', 'gate_cache', 'ramp_cache', 'profile', 'result_cache'],
+	'logs': ['out', 'chunk']}
+
+# Results of a run that are not in its checkpoint
+scalars = ['energy', 'iterations', 'converged']
+
+# Does this point use the cache?
+# (functions of t as ramps, see helpers.Model_At, have no key, and
+# random initial states without init['seed'] are a new sample every run)
+def Enabled(module, model, sim, init, logs):
+	if (any([callable(ramp) for ramp in model.get('ramp', {}).values()])):
+		return False
+	if (helpers.Random_State(init) and init.get('seed') is None):
+		return False
+	return bool(sim.get('result_cache')) and module == 'helpers' and not logs.get('out')
+
+# Canonical, hashable version of a parameter value: dicts sorted by key,
+# numbers as floats (so that U = 2 and U = 2.0 are the same point, which
+# they are: helpers.Operators builds its Hamiltonian from floats)
+def Canonical(value):
+	if (isinstance(value, dict)):
+		return [[str(k), Canonical(v)] for (k, v) in sorted(value.items(), key=lambda item: str(item[0]))]
+	elif (isinstance(value, (list, tuple, np.ndarray))):
+		return [Canonical(v) for v in value]
+	elif (isinstance(value, (bool, np.bool_)) or value is None):
+		return value
+	elif (isinstance(value, (int, long, float, np.integer, np.floating))):
+		return float(value)
+	else:
+		return str(value)
+
+# Hash of the source files the results of module depend on
+def Code_Version(module):
+	path = os.path.dirname(os.path.abspath(__file__))
+	h = hashlib.sha1()
+	for name in [module, 'gates']:
+		with open(os.path.join(path, name + ".py"), 'rb') as f:
+			h.update(f.read())
+	return h.hexdigest()
+
+# Everything the result of a point depends on, and its hash
+def Key(module, model, sim, init, logs):
+	sim = dict([(k, v) for (k, v) in sim.items() if k not in Ignored['sim']])
+	logs = dict([(k, v) for (k, v) in logs.items() if k not in Ignored['logs']])
+	if (not sim.get('it', False)):
+		del sim['N']
+	key = Canonical({'module': module, 'code': Code_Version(module),
+		'model': model, 'sim': sim, 'init': init, 'logs': logs})
+	return key, hashlib.sha1(json.dumps(key)).hexdigest()
+
+# Best entry for a point: the run with the same N, or else (time evolution
+# only) the longest one with a smaller N to continue from. Returns
+# {'path': checkpoint file, 'N': its N, plus the scalar results},
+# or None if the cache has nothing to start from.
+def Lookup(module, model, sim, init, logs):
+	key, digest = Key(module, model, sim, init, logs)
+	best = None
+	for filename in glob.glob(os.path.join(sim['result_cache'], digest, "N_*.json")):
+		with open(filename) as f:
+			entry = json.load(f)
+		# (a hash collision, or an entry written by hand)
+		if (entry['key'] != key):
+			continue
+		if (entry['N'] == sim['N'] or (not sim.get('it', False) and entry['N'] < sim['N'] and
+				(best is None or entry['N'] > best['N']))):
+			best = entry
+			best['path'] = filename[:-len(".json")] + ".npz"
+		if (best is not None and best['N'] == sim['N']):
+			break
+	return best
+
+# Is the point in the cache with all of its N iterations?
+def Complete(module, model, sim, init, logs):
+	if (not Enabled(module, model, sim, init, logs)):
+		return False
+	entry = Lookup(module, model, sim, init, logs)
+	return entry is not None and entry['N'] == sim['N']
+
+# Set simulation (a helpers.TEBD) to the state of a cache entry
+def Load(simulation, entry):
+	simulation.Load_Checkpoint(entry['path'])
+	for name in scalars:
+		if (name in entry):
+			setattr(simulation, name, entry[name])
+
+# Add a finished run to the cache
+def Store(simulation, module):
+	model = simulation.model; sim = simulation.sim
+	key, digest = Key(module, model, sim, simulation.init, simulation.logs)
+	path = os.path.join(sim['result_cache'], digest)
+	if (not os.path.isdir(path)):
+		os.makedirs(path)
+	base = os.path.join(path, "N_{0}".format(sim['N']))
+	simulation.Save_Checkpoint(base + ".npz")
+	entry = {'key': key, 'N': sim['N'], 'tau': simulation.tau,
+		'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+	for name in scalars:
+		if (hasattr(simulation, name)):
+			entry[name] = np.asarray(getattr(simulation, name)).item()
+	# The JSON file marks the entry as complete, so it goes last
+	tmp = base + ".json.{0}.tmp".format(os.getpid())
+	with open(tmp, 'w') as f:
+		json.dump(entry, f)
+	os.rename(tmp, base + ".json")
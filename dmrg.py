@@ -0,0 +1,233 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Finite-size two-site DMRG for the ground state of the
+# Bose-Hubbard model, as a starting point for TEBD quenches.
+#
+# Sources:
+# Schollwoeck, Annals of Physics 326, 96-192 (2011), sections 6.2-6.4.
+#
+# The Hamiltonian is that of helpers.Operators in imaginary time,
+# H = -J sum (a^dag_i a_(i+1) + h.c.) + U/2 sum n_i (n_i - 1) - mu sum n_i
+# with mu = sim['mu'] * U, written as a matrix product operator
+# (with site-dependent J, U and local chemical potentials, model['mu_site'],
+# as in helpers.Operators).
+# The MPS uses the same (d x chi_(l-1) x chi_l) tensors as helpers.TEBD;
+# the result is handed over in the TEBD layout (tensorA, Lambda), and
+# To_TEBD sets up a TEBD simulation that starts from it, e.g. for a quench:
+#	ground = dmrg.DMRG(model, sim, init)
+#	ground.Run()
+#	simulation = ground.To_TEBD(quench_model, sim, logs)
+#	simulation.Run_Simulation()
+#
+# The sweeps are done in double precision whatever sim['precision'] is.
+
+import numpy as np
+import math
+import helpers
+
+# Finite-size two-site DMRG
+class DMRG(object):
+	# Start from the product state that helpers.TEBD would start from.
+	# Without sim['sym'] this finds the ground state of H - mu * N at any
+	# filling; with sim['sym'] the number of particles of the (Fock)
+	# initial state is kept, and the SVDs are done one charge block
+	# at a time as in helpers.Evolve_Bond.
+	def __init__(self, model, sim, init):
+		self.model = model
+		self.sim = sim
+		self.init = init
+		d = sim['d']; L = sim['L']
+		coeffs = helpers.Initialize_States(sim, init)
+		self.sym = sim.get('sym', False)
+		if (self.sym):
+			self.charges, self.n_total = helpers.Charges0(coeffs, sim)
+		self.M = []
+		for i in range(0, L):
+			mat = np.zeros((d, 1, 1), dtype=np.complex128)
+			mat[:, 0, 0] = coeffs[i, :] / np.linalg.norm(coeffs[i, :])
+			self.M.append(mat)
+		self.W = Bose_Hubbard_MPO(model, sim)
+
+		# Environments: Left[l] holds sites 0, ..., l-1 and Right[l]
+		# holds sites l+1, ..., L-1, with indices (bra, MPO, ket)
+		self.Left = [None] * L
+		self.Right = [None] * L
+		self.Left[0] = np.ones((1, 1, 1))
+		self.Right[L-1] = np.ones((1, 1, 1))
+		# The product state is right-orthonormal already
+		for l in range(L-1, 0, -1):
+			self.Right[l-1] = Right_Environment(self.Right[l], self.W[l], self.M[l])
+
+	# Sweep back and forth until the energy changes by less than
+	# sim['tol'] (default 1E-10) between sweeps, or sim['sweeps'] times
+	# (default 20). Sets self.energy, self.sweeps and self.converged,
+	# and the state in the TEBD layout, self.tensorA and self.Lambda.
+	def Run(self):
+		L = self.sim['L']
+		tol = self.sim.get('tol', 1E-10)
+		sweeps = self.sim.get('sweeps', 20)
+
+		self.energy = None
+		self.converged = False
+		for self.sweeps in range(1, sweeps + 1):
+			last = self.energy
+			for l in range(0, L-1):
+				self.energy = self.Optimize_Bond(l, 'right')
+			for l in range(L-2, -1, -1):
+				self.energy = self.Optimize_Bond(l, 'left')
+			print "sweep {0}: E = {1}, chi = {2}".format(self.sweeps, self.energy, max([M.shape[2] for M in self.M]))
+			if (last is not None and abs(self.energy - last) < tol):
+				self.converged = True
+				break
+
+		if (self.sym):
+			self.tensorA, self.Lambda, self.charges, discarded = helpers.Canonical_Form(self.M, self.charges, self.n_total, self.sim)
+		else:
+			self.tensorA, self.Lambda, charges, discarded = helpers.Canonical_Form(self.M, None, 0, self.sim)
+		return self.energy
+
+	# Find the lowest eigenvector of the effective Hamiltonian of sites l, l+1
+	# and split it again, leaving the orthogonality center on site l+1
+	# (direction 'right') or site l ('left'). Returns the energy.
+	def Optimize_Bond(self, l, direction):
+		d = self.sim['d']; L = self.sim['L']
+		Theta = helpers.Theta_Tensor(self.M[l], self.M[l+1])
+		Left = self.Left[l]; Right = self.Right[l+1]
+		W_l = self.W[l]; W_lp1 = self.W[l+1]
+		apply = lambda x: Effective_H(Left, W_l, W_lp1, Right, x)
+		energy, Theta = Lanczos(apply, Theta, self.sim.get('lanczos', 20))
+
+		# Split as in helpers.Evolve_Bond, Phi = U S V^dag,
+		# keeping U (moving right) or V (moving left)
+		chi_l = Theta.shape[2]; chi_r = Theta.shape[3]
+		Phi = np.reshape(np.transpose(Theta, (0,2,1,3)), (d*chi_l, d*chi_r))
+		if (self.sym):
+			# Particles on sites 0, ..., l for the rows and columns of Phi
+			if (l != 0):
+				q_left = self.charges[l-1]
+			else:
+				q_left = np.zeros(1, dtype=int)
+			if (l != L - 2):
+				q_right = self.charges[l+1]
+			else:
+				q_right = np.array([self.n_total])
+			q_row = np.reshape(np.arange(d)[:, None] + q_left[None, :], -1)
+			q_col = np.reshape(q_right[None, :] - np.arange(d)[:, None], -1)
+		else:
+			q_row = None; q_col = None
+		if (direction == 'right'):
+			U, S, q = helpers.Left_SVD(Phi, q_row, q_col)
+		else:
+			V, S, q = helpers.Left_SVD(np.conjugate(np.transpose(Phi)), q_col, q_row)
+		chi = helpers.Bond_Dimension(S, self.sim)
+		if (self.sym):
+			self.charges[l] = q[0:chi]
+
+		if (direction == 'right'):
+			U = U[:, 0:chi]
+			center = np.dot(np.conjugate(np.transpose(U)), Phi)
+			center = center / np.linalg.norm(center)
+			self.M[l] = np.reshape(U, (d, chi_l, chi))
+			self.M[l+1] = np.transpose(np.reshape(center, (chi, d, chi_r)), (1,0,2))
+			self.Left[l+1] = Left_Environment(self.Left[l], self.W[l], self.M[l])
+		else:
+			V = V[:, 0:chi]
+			center = np.dot(Phi, V)
+			center = center / np.linalg.norm(center)
+			self.M[l] = np.reshape(center, (d, chi_l, chi))
+			self.M[l+1] = np.transpose(np.reshape(np.conjugate(np.transpose(V)), (chi, d, chi_r)), (1,0,2))
+			self.Right[l] = Right_Environment(self.Right[l+1], self.W[l+1], self.M[l+1])
+		return energy
+
+	# A TEBD simulation (helpers.TEBD) that starts from the ground state,
+	# e.g. with a different model for a quench
+	def To_TEBD(self, model, sim, logs):
+		simulation = helpers.TEBD(model, sim, self.init, logs)
+		simulation.Set_State(self.tensorA)
+		return simulation
+
+# Matrix product operator of the Bose-Hubbard Hamiltonian:
+# a list of L tensors W[l] with indices (left bond, right bond, s, s'),
+# built from the operator valued matrices
+#	[[ I,           0,           0,    0 ],
+#	 [ a,           0,           0,    0 ],
+#	 [ a^dag,       0,           0,    0 ],
+#	 [ h_l, -J_l a^dag,      -J_l a,     I ]]
+# with h_l = U_l/2 n (n - 1) - mu_l n (J, U and the local chemical
+# potential as in helpers.Operators, plus sim['mu'] * U_l);
+# the first site takes the last row and the last site the first column.
+def Bose_Hubbard_MPO(model, sim):
+	d = sim['d']; L = sim['L']
+	J = helpers.Site_Values(model['J'], L-1, 'J')
+	U = helpers.Site_Values(model['U'], L, 'U')
+	mu = helpers.Site_Values(model.get('mu_site', 0), L, 'mu_site') + sim.get('mu', 0) * U
+	a = np.zeros((d,d))
+	for i in range(0,d-1):
+		a[i, i+1] = math.sqrt(i+1)
+	a_dag = np.transpose(a)
+	n_op = np.dot(a_dag, a)
+	I = np.identity(d)
+
+	MPO = []
+	for l in range(0, L):
+		W = np.zeros((4, 4, d, d))
+		W[0, 0] = I
+		W[1, 0] = a
+		W[2, 0] = a_dag
+		W[3, 0] = (U[l] / 2) * np.dot(n_op, n_op - I) - mu[l] * n_op
+		if (l < L - 1):
+			W[3, 1] = -J[l] * a_dag
+			W[3, 2] = -J[l] * a
+		W[3, 3] = I
+		if (l == 0):
+			W = W[3:4, :]
+		if (l == L - 1):
+			W = W[:, 0:1]
+		MPO.append(W)
+	return MPO
+
+# Add site l (tensor A, MPO tensor W) to the left environment Left
+def Left_Environment(Left, W, A):
+	x = np.tensordot(Left, A, axes=(2,1))
+	x = np.tensordot(x, W, axes=([1,2],[0,3]))
+	x = np.tensordot(x, np.conjugate(A), axes=([0,3],[1,0]))
+	return np.transpose(x, (2,1,0))
+
+# Add site l (tensor B, MPO tensor W) to the right environment Right
+def Right_Environment(Right, W, B):
+	x = np.tensordot(B, Right, axes=(2,2))
+	x = np.tensordot(x, W, axes=([0,3],[3,1]))
+	x = np.tensordot(x, np.conjugate(B), axes=([3,1],[0,2]))
+	return np.transpose(x, (2,1,0))
+
+# Effective Hamiltonian of two sites acting on Theta,
+# indices [i_l, i_(l+1), a_(l-1), a_(l+1)] as in helpers.Theta_Tensor
+def Effective_H(Left, W_l, W_lp1, Right, Theta):
+	x = np.tensordot(Left, Theta, axes=(2,2))
+	x = np.tensordot(x, W_l, axes=([1,2],[0,3]))
+	x = np.tensordot(x, W_lp1, axes=([3,1],[0,3]))
+	x = np.tensordot(x, Right, axes=([3,1],[1,2]))
+	return np.transpose(x, (1,2,0,3))
+
+# Lowest eigenvalue and eigenvector of the Hermitian map apply,
+# by at most k Lanczos iterations starting from v0
+# (with full reorthogonalization, the Krylov spaces here are small)
+def Lanczos(apply, v0, k, tol=1E-13):
+	shape = v0.shape
+	v = np.reshape(v0, -1) / np.linalg.norm(v0)
+	V = [v]; alpha = []; beta = []
+	for j in range(0, k):
+		w = np.reshape(apply(np.reshape(V[j], shape)), -1)
+		alpha.append(np.real(np.vdot(V[j], w)))
+		for u in V:
+			w = w - np.vdot(u, w) * u
+		b = np.linalg.norm(w)
+		if (b < tol or j == k - 1):
+			break
+		beta.append(b)
+		V.append(w / b)
+	m = len(alpha)
+	T = np.diag(alpha) + np.diag(beta[0:m-1], 1) + np.diag(beta[0:m-1], -1)
+	w, y = np.linalg.eigh(T)
+	x = np.dot(y[:, 0], np.array(V[0:m]))
+	return w[0], np.reshape(x / np.linalg.norm(x), shape)
@@ -0,0 +1,135 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Ensembles of random initial states.
+#
+# With flag = 0 and a fractional nbar, helpers.Initialize_States puts the
+# extra particles on random sites, so every run is one sample. Run_Ensemble
+# runs many samples, seeded init['seed'] = seed, seed + 1, ..., in a pool
+# of worker processes, and folds the logged arrays of each sample into a
+# running mean and variance (Statistics) as soon as it arrives, so the
+# trajectories of the samples are never held in memory together. The
+# standard error of the mean is printed after every sample.
+#
+# The samples of a seed are the same in every run and every process, so
+# an ensemble can be repeated or extended with more samples, and the
+# points of a sweep (Run_Sweep) all see the same random configurations.
+#
+# Works with helpers.TEBD and helpers_2species.TEBD;
+# no streaming (logs['out']) or checkpoints.
+
+import numpy as np
+import importlib
+import sweep
+
+# Running mean and variance of named arrays (Welford's algorithm),
+# updated one sample at a time. Complex arrays get the variance of
+# their absolute deviation, E|x - mean|^2.
+class Statistics(object):
+	def __init__(self):
+		self.count = 0
+		self.mean = {}
+		# Sum of the squared deviations from the mean
+		self.M2 = {}
+
+	# Fold in one sample, a dict of arrays (or numbers)
+	def Add(self, sample):
+		self.count += 1
+		for name in sample:
+			x = np.array(sample[name])
+			if (not np.iscomplexobj(x)):
+				x = x.astype(np.float64)
+			if (self.count == 1):
+				self.mean[name] = x
+				self.M2[name] = np.zeros(x.shape)
+			else:
+				delta = x - self.mean[name]
+				self.mean[name] = self.mean[name] + delta / self.count
+				self.M2[name] += np.real(np.conjugate(delta) * (x - self.mean[name]))
+
+	# Sample variance (zero with fewer than two samples)
+	def Variance(self, name):
+		if (self.count < 2):
+			return np.zeros(self.M2[name].shape)
+		return self.M2[name] / (self.count - 1)
+
+	# Standard error of the mean
+	def Error(self, name):
+		return np.sqrt(self.Variance(name) / self.count)
+
+# Run a single sample; this is what the workers execute.
+# args = (module, model, sim, init, logs, fields)
+def Run_Sample(args):
+	module, model, sim, init, logs, fields = args
+	helpers = importlib.import_module(module)
+	simulation = helpers.TEBD(model, sim, init, logs)
+	simulation.Run_Simulation()
+	sample = {'tau': simulation.tau}
+	for field in fields:
+		sample[field] = getattr(simulation, field)
+	return sample
+
+# Run samples samples of the point (model, sim, init, logs), with seeds
+# seed, seed + 1, ..., in workers processes (1 runs them in this process).
+# fields: logged arrays to average (and the truncation error tau always)
+# Returns the Statistics of the samples.
+def Run_Ensemble(module, model, sim, init, logs, samples, seed=0, workers=1,
+		fields=('a_avg', 'n_avg'), report=True):
+	if (logs.get('out') or sim.get('checkpoint')):
+		raise ValueError("ensembles do not support logs['out'] or sim['checkpoint']")
+	jobs = []
+	for k in range(0, samples):
+		sample_init = dict(init, seed=seed + k)
+		jobs.append((module, model, sim, sample_init, logs, list(fields)))
+
+	stats = Statistics()
+	pool = None
+	if (workers > 1):
+		pool = sweep.Point_Pool(workers, sim)
+		results = pool.imap_unordered(Run_Sample, jobs)
+	else:
+		results = (Run_Sample(job) for job in jobs)
+	try:
+		for sample in results:
+			stats.Add(sample)
+			if (report):
+				errors = ["{0} {1:.3e}".format(field, np.max(stats.Error(field))) for field in fields]
+				print "sample {0}/{1}: largest standard error {2}".format(stats.count, samples, ", ".join(errors))
+	finally:
+		if (pool is not None):
+			pool.close()
+			pool.join()
+	return stats
+
+# Ensemble version of sweep.Run_Sweep: every point of sweep_range is an
+# ensemble of samples samples (Run_Ensemble), its parameters and mean
+# truncation error go to <prefix>_<index>_<par>=<value>....txt.
+# Returns the same table as sweep.Run_Sweep with the mean of each field,
+# plus its standard error (field + '_err'); saved as <prefix>_sweep.npz.
+def Run_Sweep(module, model, sim, init, logs, sweep_par, sweep_range, prefix,
+		samples, seed=0, workers=1, fields=('a_avg', 'n_avg')):
+	table = {'params': np.array(sweep_range, dtype=float)}
+	means = dict([(name, []) for name in ['tau'] + list(fields)])
+	errors = dict([(name, []) for name in ['tau'] + list(fields)])
+	for i in range(0, len(sweep_range)):
+		point_model, point_sim, point_init, point_logs = sweep.Point(model, sim, init, logs, sweep_par, sweep_range[i])
+		name = sweep.Point_Name(prefix, i, sweep_par, sweep_range[i])
+		stats = Run_Ensemble(module, point_model, point_sim, point_init, point_logs, samples,
+			seed=seed, workers=workers, fields=fields)
+		for field in means:
+			means[field].append(stats.mean[field])
+			errors[field].append(stats.Error(field))
+
+		f = open(name + ".txt", 'w')
+		f.write("model = {0}\n".format(point_model))
+		f.write("sim = {0}\n".format(point_sim))
+		f.write("init = {0}\n".format(point_init))
+		f.write("logs = {0}\n".format(point_logs))
+		f.write("samples = {0} (seeds {1} to {2})\n".format(samples, seed, seed + samples - 1))
+		f.write("error = {0} +- {1}".format(stats.mean['tau'], stats.Error('tau')))
+		f.close()
+
+	for field in means:
+		table[field] = np.array(means[field])
+		table[field + '_err'] = np.array(errors[field])
+	np.savez(prefix + "_sweep.npz", names=np.array(sweep_par), **table)
+	return table
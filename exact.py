@@ -0,0 +1,251 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Exact reference solutions of the Bose-Hubbard chain of helpers.py,
+# for small chains (L up to about 14, depending on d and the filling).
+#
+# Takes the same model, sim, init and logs dicts as helpers.TEBD:
+# the same open chain with at most d - 1 bosons per site,
+#	H = -J sum (a^dag_i a_(i+1) + h.c.) + U/2 sum n_i (n_i - 1) - sum mu_i n_i,
+# started from the same product state (helpers.Initialize_States), and
+# logs a_avg, n_avg and n2_avg on the same time grid, with no Trotter or
+# truncation error. The state vector is evolved from one logged step to
+# the next by the Krylov method of scipy.sparse.linalg.expm_multiply.
+# With sim['it'] it finds the ground state instead (scipy.sparse.linalg.eigsh)
+# of H - mu * N with mu = sim['mu'] * U as in helpers.Operators, at any
+# filling, or with sim['sym'] at the particle number of the initial Fock state.
+#
+# The basis states are Fock states |n_0, n_1, ..., n_(L-1)>, indexed as in
+# the Kronecker product of the site bases (site 0 most significant).
+# With sim['sym'] the basis is split by the total particle number, which
+# H conserves: every number sector is evolved on its own, which keeps the
+# Krylov spaces small; the initial state may still mix sectors (e.g. a
+# coherent state). Without it, the whole d^L dimensional space is used.
+#
+# scipy is optional: without it H is a dense matrix and states are evolved
+# by diagonalizing it once, which only works for a few thousand states.
+#
+# Usage, e.g. to check a TEBD run:
+#	reference = exact.Exact(model, sim, init, logs)
+#	reference.Run_Simulation()
+#	print np.max(np.abs(reference.n_avg - simulation.n_avg))
+
+import numpy as np
+import math
+import helpers
+try:
+	import scipy.sparse
+	import scipy.sparse.linalg
+except ImportError:
+	scipy = None
+
+class Exact(object):
+	def __init__(self, model, sim, init, logs):
+		self.model = model
+		self.sim = sim
+		self.init = init
+		self.logs = logs
+		if (model.get('ramp')):
+			raise ValueError("exact.py does not support model['ramp']")
+		L = sim['L']; d = sim['d']
+
+		# Product initial state, one number sector at a time, only in the
+		# sectors it has weight in (a single sector, None, without sim['sym'])
+		coeffs = helpers.Initialize_States(dict(sim, precision='double'), init)
+		self.sym = sim.get('sym', False)
+		if (self.sym):
+			sectors = Sectors(coeffs)
+		else:
+			sectors = [None]
+		self.occ = {}; self.codes = {}; self.psi = {}
+		for N in sectors:
+			occ, codes = Basis(L, d, N)
+			psi = np.ones(len(codes), dtype=np.complex128)
+			for i in range(0, L):
+				psi *= coeffs[i, occ[:, i]]
+			# Sectors the state has no weight in never get any
+			if (np.any(psi != 0)):
+				self.occ[N] = occ; self.codes[N] = codes; self.psi[N] = psi
+		norm = math.sqrt(sum([np.vdot(psi, psi).real for psi in self.psi.values()]))
+		for N in self.psi:
+			self.psi[N] = self.psi[N] / norm
+		self.dim = sum([len(codes) for codes in self.codes.values()])
+
+		if (sim.get('it', False)):
+			T = 1
+		else:
+			T = sim['N'] // (logs['skip'] + 1) + 1
+		self.a_avg = np.zeros((L, T if logs['a'] else 0), dtype=np.complex128)
+		self.n_avg = np.zeros((L, T if logs['n'] else 0))
+		self.n2_avg = np.zeros((L, T if logs.get('n2', False) else 0))
+		self.tau = 0
+
+	# Evolve to time N * delta, logging every logs['skip'] + 1 steps
+	# (or find the ground state with sim['it'])
+	def Run_Simulation(self):
+		H = {}
+		for N in self.codes:
+			H[N] = Hamiltonian(self.occ[N], self.codes[N], self.model, self.sim)
+		if (self.sim.get('it', False)):
+			return self.Find_Ground_State(H)
+
+		dt = self.sim['delta'] * (self.logs['skip'] + 1)
+		T = self.sim['N'] // (self.logs['skip'] + 1) + 1
+		evolve = {}
+		for N in H:
+			evolve[N] = Propagator(H[N], dt)
+		self.Measure(0)
+		for ind in range(1, T):
+			for N in self.psi:
+				self.psi[N] = evolve[N](self.psi[N])
+			self.Measure(ind)
+		self.energy = self.Energy(H)
+
+	# Lowest eigenstate of H - mu * N over all sectors the initial state
+	# has weight in (just its own with sim['sym'] and a Fock state)
+	def Find_Ground_State(self, H):
+		L = self.sim['L']
+		mu = self.sim.get('mu', 0) * helpers.Site_Values(self.model['U'], L, 'U')
+		best = None
+		for N in H:
+			# -mu * N on the diagonal
+			H_N = H[N] - Diagonal(np.dot(self.occ[N], mu))
+			E, psi = Lowest_Eigenstate(H_N)
+			if (best is None or E < best[0]):
+				best = (E, N, psi)
+		self.energy, N, psi = best
+		self.psi = {N: psi.astype(np.complex128)}
+		self.Measure(0)
+		return self.energy
+
+	# <H> of the current state
+	def Energy(self, H):
+		return sum([np.vdot(self.psi[N], H[N].dot(self.psi[N])).real for N in self.psi])
+
+	# Log <a_i>, <n_i> and <n_i^2> at time index ind
+	def Measure(self, ind):
+		logs = self.logs
+		L = self.sim['L']; d = self.sim['d']
+		if (logs['n'] or logs.get('n2', False)):
+			n = np.zeros(L); n2 = np.zeros(L)
+			for N in self.psi:
+				p = np.absolute(self.psi[N])**2
+				n += np.dot(p, self.occ[N])
+				n2 += np.dot(p, self.occ[N]**2)
+			if (logs['n']):
+				self.n_avg[:, ind] = n
+			if (logs.get('n2', False)):
+				self.n2_avg[:, ind] = n2
+		if (logs['a']):
+			# <a_i> connects sector N with sector N - 1
+			for i in range(0, L):
+				value = 0
+				for N in self.psi:
+					if (N is None):
+						M = None
+					else:
+						M = N - 1
+					if (M not in self.psi):
+						continue
+					src, dst, amp = Lowering(self.occ[N], self.codes[N], self.codes[M], i, d)
+					value += np.sum(np.conjugate(self.psi[M][dst]) * amp * self.psi[N][src])
+				self.a_avg[i, ind] = value
+
+# Fock states of L sites with up to d - 1 bosons each, and total
+# number N (all of them if N is None), as occupations occ[state, site]
+# sorted by their index codes[state] in the full d^L dimensional basis
+# (occupations are stored as int16 to keep the full basis small)
+def Basis(L, d, N=None):
+	if (N is None):
+		codes = np.arange(d**L, dtype=np.int64)
+		occ = (codes[:, None] // d**np.arange(L-1, -1, -1, dtype=np.int64)) % d
+		return occ.astype(np.int16), codes
+	# Add one site at a time, dropping partial states that already
+	# have too many particles or can no longer reach N
+	occ = np.zeros((1, 0), dtype=np.int16)
+	for i in range(0, L):
+		occ = np.concatenate([np.hstack([occ, np.full((len(occ), 1), n, dtype=np.int16)]) for n in range(0, d)])
+		total = np.sum(occ, axis=1)
+		occ = occ[(total <= N) & (total + (d-1) * (L-i-1) >= N)]
+	codes = Codes(occ, d)
+	order = np.argsort(codes)
+	return occ[order], codes[order]
+
+# Particle numbers a product state coeffs[site, n] has weight in:
+# every sum of occupations with nonzero amplitudes on their sites
+def Sectors(coeffs):
+	sectors = set([0])
+	for i in range(0, coeffs.shape[0]):
+		occupations = np.nonzero(coeffs[i])[0]
+		sectors = set([N + n for N in sectors for n in occupations])
+	return sorted(sectors)
+
+# Index of the Fock states occ[state, site] in the full basis
+def Codes(occ, d):
+	L = occ.shape[1]
+	return np.dot(occ, d**np.arange(L-1, -1, -1, dtype=np.int64))
+
+# Matrix elements of a_i between the states (occ, codes) and the states
+# target_codes: returns the states src with n_i > 0, the index dst of
+# the state with one boson less on site i, and sqrt(n_i)
+def Lowering(occ, codes, target_codes, i, d):
+	L = occ.shape[1]
+	src = np.nonzero(occ[:, i] > 0)[0]
+	lowered = codes[src] - d**(L-1-i)
+	dst = np.searchsorted(target_codes, lowered)
+	return src, dst, np.sqrt(occ[src, i].astype(np.float64))
+
+# Bose-Hubbard Hamiltonian on the states (occ, codes), sorted by code,
+# as a sparse matrix (a dense one without scipy); J, U and the local
+# chemical potential mu may depend on the bond or site as in helpers.Operators
+def Hamiltonian(occ, codes, model, sim):
+	L = occ.shape[1]; d = sim['d']
+	J = helpers.Site_Values(model['J'], L-1, 'J')
+	U = helpers.Site_Values(model['U'], L, 'U')
+	mu = helpers.Site_Values(model.get('mu_site', 0), L, 'mu_site')
+	rows = []; cols = []; values = []
+
+	# Onsite energy U/2 n (n - 1) - mu n
+	rows.append(np.arange(len(codes))); cols.append(np.arange(len(codes)))
+	values.append(np.dot(occ * (occ - 1.0), U / 2.0) - np.dot(occ, mu))
+
+	# Hopping -J a^dag_(i+1) a_i between sites i and i+1 (and its conjugate):
+	# states with a boson on site i and room for one on site i+1
+	for i in range(0, L-1):
+		src = np.nonzero((occ[:, i] > 0) & (occ[:, i+1] < d - 1))[0]
+		hopped = codes[src] - d**(L-1-i) + d**(L-2-i)
+		dst = np.searchsorted(codes, hopped)
+		amp = -J[i] * np.sqrt(occ[src, i] * (occ[src, i+1] + 1.0))
+		rows += [dst, src]; cols += [src, dst]; values += [amp, amp]
+
+	rows = np.concatenate(rows); cols = np.concatenate(cols); values = np.concatenate(values)
+	if (scipy is not None):
+		return scipy.sparse.csr_matrix((values, (rows, cols)), shape=(len(codes), len(codes)))
+	H = np.zeros((len(codes), len(codes)))
+	np.add.at(H, (rows, cols), values)
+	return H
+
+# Diagonal matrix of the same kind as Hamiltonian returns
+def Diagonal(values):
+	if (scipy is not None):
+		return scipy.sparse.diags(values.astype(np.float64), 0, format='csr')
+	return np.diag(values.astype(np.float64))
+
+# Function that evolves a state by exp(-i dt H)
+def Propagator(H, dt):
+	if (scipy is not None):
+		A = -1j * dt * H
+		return lambda psi: scipy.sparse.linalg.expm_multiply(A, psi)
+	w, v = np.linalg.eigh(H)
+	phases = np.exp(-1j * dt * w)
+	return lambda psi: np.dot(v, phases * np.dot(np.conjugate(np.transpose(v)), psi))
+
+# Lowest eigenvalue and eigenvector of the Hermitian matrix H
+def Lowest_Eigenstate(H):
+	# (eigsh needs at least a few states; small blocks are done dense)
+	if (scipy is None or H.shape[0] <= 16):
+		if (scipy is not None):
+			H = H.toarray()
+		w, v = np.linalg.eigh(H)
+		return w[0], v[:, 0]
+	w, v = scipy.sparse.linalg.eigsh(H, k=1, which='SA')
+	return w[0], v[:, 0]
@@ -0,0 +1,116 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Cache for the gates built by the Operators classes of
+# helpers.py and helpers_2species.py.
+#
+# Building Operators means building the Hamiltonians and diagonalizing
+# them, which dominates the start-up of a run for large d. Sweeps,
+# restarts and time-dependent protocols keep asking for the same
+# parameters, so Cached_Operators keeps every Operators object it builds
+# in memory, keyed by the parameters it depends on, and optionally
+# pickles it to the directory sim['gate_cache'] to share it between
+# processes and runs. Time-dependent (ramped) models use a Bounded_Cache
+# instead, which only keeps the last few sets of gates.
+
+import numpy as np
+import os
+import sys
+import hashlib
+import collections
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+# In-memory cache: Key(...) -> Operators object
+_cache = {}
+
+# Hashes of the source of the modules defining Operators classes
+_versions = {}
+
+# Everything the gates built by cls(model, sim) depend on, including the
+# source of the module defining cls, so that gates pickled to
+# sim['gate_cache'] by older code are never handed to newer code
+def Key(cls, model, sim):
+	key = [cls.__module__, cls.__name__, Code_Version(cls), Freeze(model)]
+	for name in ['d', 'da', 'db', 'L', 'delta', 'it', 'mu', 'precision']:
+		key.append((name, Freeze(sim.get(name))))
+	return tuple(key)
+
+# Hash of the source file of the module defining cls
+def Code_Version(cls):
+	module = sys.modules[cls.__module__]
+	if (module.__name__ not in _versions):
+		filename = module.__file__
+		if (filename.endswith(".pyc")):
+			filename = filename[:-1]
+		with open(filename, 'rb') as f:
+			_versions[module.__name__] = hashlib.sha1(f.read()).hexdigest()
+	return _versions[module.__name__]
+
+# Hashable version of a parameter value (dicts, lists and arrays become tuples)
+# and numbers floats: the Operators classes build their Hamiltonians from
+# float parameters, so that U = 3 and U = 3.0 give the same gates
+def Freeze(value):
+	if (isinstance(value, dict)):
+		return tuple(sorted([(k, Freeze(v)) for (k, v) in value.items()]))
+	elif (isinstance(value, (list, tuple, np.ndarray))):
+		return tuple([Freeze(v) for v in value])
+	elif (isinstance(value, (int, long, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))):
+		return float(value)
+	else:
+		return value
+
+# Operators for these parameters, built only if they were never
+# built before in this process (or found in sim['gate_cache'])
+def Cached_Operators(cls, model, sim):
+	key = Key(cls, model, sim)
+	if (key in _cache):
+		return _cache[key]
+
+	path = sim.get('gate_cache')
+	if (path):
+		filename = os.path.join(path, hashlib.sha1(repr(key)).hexdigest() + ".pkl")
+	if (path and os.path.exists(filename)):
+		with open(filename, 'rb') as f:
+			ops = pickle.load(f)
+	else:
+		ops = cls(model, sim)
+		if (path):
+			if (not os.path.isdir(path)):
+				os.makedirs(path)
+			# Write under a temporary name first, other processes may be reading
+			tmp = filename + ".{0}.tmp".format(os.getpid())
+			with open(tmp, 'wb') as f:
+				pickle.dump(ops, f, pickle.HIGHEST_PROTOCOL)
+			os.rename(tmp, filename)
+
+	_cache[key] = ops
+	return ops
+
+# Forget everything in the in-memory cache
+def Clear():
+	_cache.clear()
+
+# Small cache of its own for the operators of a ramp (helpers.Model_At):
+# a ramp passes through a new set of parameters every few steps, so
+# keeping all of them (as Cached_Operators does) would grow with the
+# length of the run. Keeps the maxsize most recently used Operators
+# objects and never writes them to sim['gate_cache'].
+class Bounded_Cache(object):
+	def __init__(self, maxsize=4):
+		self.maxsize = maxsize
+		self.entries = collections.OrderedDict()
+
+	# Operators for these parameters, built if they are not among the
+	# most recently used ones
+	def Operators(self, cls, model, sim):
+		key = Key(cls, model, sim)
+		if (key in self.entries):
+			ops = self.entries.pop(key)
+		else:
+			ops = cls(model, sim)
+		self.entries[key] = ops
+		while (len(self.entries) > self.maxsize):
+			self.entries.popitem(last=False)
+		return ops
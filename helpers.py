@@ -13,11 +13,31 @@
 #
 # Note: this is the cleaned-up version of the code;
 # partial implementations of two-site reduced density matrices,
-# imaginary time evolution, two-species evolution can be accessed
-# in older versions of the code on github.
+# two-species evolution can be accessed in older versions of the
+# code on github. Imaginary time evolution (ground states) is
+# done here, see TEBD.Find_Ground_State.
 
 import numpy as np
 import math
+import os
+import time
+import storage
+import gates
+import profiling
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# Optional: limits BLAS threads inside pool workers (see Limit_BLAS)
+try:
+	from threadpoolctl import threadpool_limits
+except ImportError:
+	threadpool_limits = None
+# BLAS limits set in this process by Limit_BLAS
+_blas_limits = None
+# Environment variables that set the number of BLAS threads, as they were
+# when this module was loaded: BLAS reads them once, when numpy loads it
+blas_variables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+_blas_environ = dict([(var, os.environ.get(var)) for var in blas_variables])
 
 # Class for handling the Lambda, Gamma, and Theta tensors
 class TEBD(object):
@@ -30,154 +50,622 @@ class TEBD(object):
 		# Build the A_l tensors from the Gamma_l's
 		for i in range(1, L):
 			self.tensorA[i] = np.transpose(np.tensordot(np.diag(self.Lambda[i-1]), self.tensorA[i], axes=(0,1)), (1,0,2))
+		# In the particle-number conserving mode, every Schmidt value
+		# on bond l carries the number of particles on sites 0, ..., l
+		if (sim.get('sym', False)):
+			self.charges, self.n_total = Charges0(coeffs, sim)
 		self.tau = 0
+		# Last completed iteration (nonzero after Load_Checkpoint)
+		self.step = 0
 		self.model = model
 		self.sim = sim
 		self.init = init
 		self.logs = logs
-		self.rhos = np.zeros((sim['L'], sim['N']+1, sim['d'], sim['d']), dtype=np.complex64)
-		self.a_avg = np.zeros((sim['L'], sim['N']+1), dtype=np.complex64)
-		self.n_avg = np.zeros((sim['L'], sim['N']+1))
-		self.aa = np.zeros((sim['L'], sim['L']), dtype=np.complex64)
+		# Arrays for the logged data, one column per logged step.
+		# With logs['out'], samples are streamed to disk instead
+		# and the arrays only hold the current sample.
+		# In ground state mode (sim['it']) only the final state is logged.
+		if (logs.get('out')):
+			self.sink = storage.Sink(logs['out'], logs.get('chunk', 1000))
+			T = 1
+		else:
+			self.sink = None
+			if (sim.get('it', False)):
+				T = 1
+			else:
+				T = sim['N'] // (logs['skip'] + 1) + 1
+		L = sim['L']; d = sim['d']
+		cdtype, rdtype = Dtypes(sim)
+		self.rhos = np.zeros((L, T if logs['rho'] else 0, d, d), dtype=cdtype)
+		self.a_avg = np.zeros((L, T if logs['a'] else 0), dtype=cdtype)
+		self.n_avg = np.zeros((L, T if logs['n'] else 0))
+		self.n2_avg = np.zeros((L, T if logs.get('n2', False) else 0))
+		# Energy of every bond (its two-site Hamiltonian); the total
+		# is their sum, the latest in self.energy and the first in self.E0
+		self.E_bond = np.zeros((L-1, T if logs.get('E', False) else 0))
+		# Correlations aa[i, t, j] = <a^dag_i a_j> and nn[i, t, j] = <n_i n_j>
+		self.aa = np.zeros((L, T if logs.get('aa', False) else 0, L), dtype=cdtype)
+		self.nn = np.zeros((L, T if logs.get('aa', False) else 0, L))
+		self.bond_energies = np.zeros(L-1)
+		# Entanglement of every bond, read off its Schmidt values:
+		# the von Neumann entropy S, the Renyi entropies S_renyi[l, t, m]
+		# of the orders logs['renyi'][m], the weight discarded on each bond
+		# since the previous logged step, and the logs['schmidt'] largest
+		# Schmidt values (padded with zeros)
+		S = logs.get('S', False)
+		self.S = np.zeros((L-1, T if S else 0))
+		self.S_renyi = np.zeros((L-1, T, len(logs.get('renyi', ()))))
+		self.discarded = np.zeros((L-1, T if S else 0))
+		self.schmidt = np.zeros((L-1, T, logs.get('schmidt', 0)))
+		self.bond_discarded = np.zeros(L-1)
+		# Two-site Hamiltonians handed to Evolve_Bond (set by Run_Simulation
+		# when logging energies), which measures each bond as it updates it
+		self.H_bond = None
+		# Names of the logged arrays above (saved in checkpoints)
+		self.fields = ['rhos', 'a_avg', 'n_avg', 'n2_avg', 'E_bond', 'aa', 'nn',
+			'S', 'S_renyi', 'discarded', 'schmidt']
+		# Breakdown of the run time with sim['profile'] (see profiling.py)
+		self.profile = None
+		# Called as callback(self, i) after every iteration i of
+		# Run_Simulation whose last layer is complete (with sim['fuse'],
+		# only the logged ones, checkpoints and the last; the others end
+		# half a step short), and after every check in ground state mode
+		self.callback = None
+		# Operators of the latest steps of a ramp (see Step_Operators)
+		self.ramp_cache = None
 
 	# The simulation loop
 	def Run_Simulation(self):
+		if (self.sim.get('profile')):
+			self.profile = profiling.Profile(memory=(self.sim['profile'] == 'memory'))
+		if (self.sim.get('it', False)):
+			energy = self.Find_Ground_State()
+			self.Finish_Profile()
+			return energy
+
 		# Define simulation parameters
 		N = self.sim['N']
 		L = self.sim['L']
 		d = self.sim['d']
 		logs = self.logs
 
-		# Define operators
-		ops = Operators(self.model, self.sim)
-		V_odd = ops.V_odd
-		V_even = ops.V_even
-		V_0 = ops.V_0
-		V_Lm2 = ops.V_Lm2
-		a_op = ops.a
-		a_dag = ops.a_dag
-		n_op = ops.n_op
+		# Define operators (built once per set of parameters).
+		# With ramps (model['ramp']), every iteration uses the operators of
+		# the parameters at its midpoint (see Model_At), which only change,
+		# and are only looked up again, when a ramped parameter crosses to
+		# the next multiple of sim['ramp_tol']; the energies are those of
+		# the Hamiltonian of the iteration they are logged in.
+		ramped = bool(self.model.get('ramp'))
+		ops = self.Step_Operators(self.step + 1)
+
+		# With logs['E'], the bonds measure their energy as they are updated
+		if (logs.get('E', False)):
+			self.H_bond = [ops.H[ops.Bond_Kind(l)] for l in range(0, L-1)]
 
 		# Create arrays to hold data
-		# and store initial values
-		if (logs['rho']):
-			for r in range(0, L):
-				self.rhos[r,0] = self.Single_Site_Rho(r)
-		if (logs['a']):
-			for r in range(0, L):
-				self.a_avg[r,0] = np.trace(np.dot(self.Single_Site_Rho(r), a_op))
-		if (logs['n']):
-			for r in range(0, L):
-				self.n_avg[r,0] = np.real(np.trace(np.dot(self.Single_Site_Rho(r), n_op)))
-
-		# # Loop: do all the odds, then evens, then odd
-		for i in range(1, N+1):
-			# Evolve odd links delta * t / 2
-			for h in range(0, L-2):
-				if h % 2 == 1:
-					self.Update(V_odd, h)
-			if (L-2) % 2 == 1:
-				self.Update(V_Lm2, L-2)		
-			
-			# Evolve even links delta * t
-			self.Update(V_0, 0)
-			for j in range(1, L-2):
-				if j % 2 == 0:
-					self.Update(V_even, j)
-			if (L-2) % 2 == 0:
-				self.Update(V_Lm2, L-2)	
+		# and store initial values (unless resuming a run)
+		if (self.step == 0):
+			if (self.sink is not None):
+				# Start from an empty directory
+				self.sink.Truncate(0)
+			with profiling.Phase(self.profile, 'measure'):
+				self.Measure(0, ops)
+
+		# Gates of each layer of the Trotter schedule (see Schedule).
+		# Every gate in a layer acts on its own pair of sites,
+		# so the updates commute.
+		schedule = Schedule(self.sim)
+		layers = [ops.Layer(parity, frac) for (parity, frac) in schedule]
+
+		# Workers for updating the bonds of a layer at the same time
+		# (stopped however the run ends, so an error does not leave them behind)
+		pool = Layer_Pool(self.sim)
+		blas = Layer_BLAS(self.sim)
+
+		try:
+			# With sim['fuse'], the last layer of one iteration and the first
+			# layer of the next (both odd for the built-in schedules) are merged
+			# into a single layer, e.g. the two odd half steps of the second
+			# order scheme become one full step exp(-i * delta * H_odd).
+			# They are only kept apart on the iterations where data is logged,
+			# and on the last one.
+			fuse = self.sim.get('fuse', False) and (schedule[0][0] == schedule[-1][0])
+			if (fuse):
+				fused = ops.Layer(schedule[-1][0], schedule[-1][1] + schedule[0][1])
+			split = True
+
+			# Checkpoints: sim['checkpoint'] is the file to write,
+			# every sim['checkpoint_every'] iterations and/or
+			# every sim['checkpoint_time'] seconds of wall-clock time,
+			# and always at the end of the run.
+			# Half steps are never fused across a checkpoint.
+			checkpoint = self.sim.get('checkpoint')
+			every = self.sim.get('checkpoint_every')
+			interval = self.sim.get('checkpoint_time')
+			last_save = time.time()
+
+			# # Loop: do all the odds, then evens, then odd
+			for i in range(self.step+1, N+1):
+				# Evolve the first layer (odd links delta * t / 2),
+				# unless already done at the end of the last iteration
+				if (split):
+					with profiling.Phase(self.profile, 'layers'):
+						self.Update_Layer(layers[0], pool)
 			
-			# Evolve odd links delta * t / 2
-			for k in range(0, L-2):
-				if k % 2 == 1:
-					self.Update(V_odd, k)
-			if (L-2) % 2 == 1:
-				self.Update(V_Lm2, L-2)
+				# Evolve the middle layers (even links delta * t)
+				for layer in layers[1:-1]:
+					with profiling.Phase(self.profile, 'layers'):
+						self.Update_Layer(layer, pool)
+
+				# Is a checkpoint due after this iteration?
+				save = False
+				if (checkpoint):
+					save = (i == N) or (every is not None and i % every == 0) or \
+						(interval is not None and time.time() - last_save >= interval)
+
+				# Operators of the next iteration: if a ramp changed them,
+				# the last layer cannot be merged with its first
+				next_ops = ops
+				if (ramped and i < N):
+					next_ops = self.Step_Operators(i + 1)
+
+				# Evolve the last layer (odd links delta * t / 2),
+				# or merge it with the first layer of the next iteration
+				split = (not fuse) or (i % (logs['skip'] + 1) == 0) or (i == N) or save or (next_ops is not ops)
+				with profiling.Phase(self.profile, 'layers'):
+					if (split):
+						self.Update_Layer(layers[-1], pool)
+					else:
+						self.Update_Layer(fused, pool)
 			
-			# Log data:
-			if (i % (logs['skip'] + 1) == 0):
-				ind = int(i / (logs['skip'] + 1))
-				if (logs['rho']):
-					# Store single particle density matrices
-					for r in range(0, L):
-						self.rhos[r,ind] = self.Single_Site_Rho(r)
-				if (logs['a']):
-					# Store expectation values of a
-					for r in range(0, L):
-						self.a_avg[r,ind] = np.trace(np.dot(self.Single_Site_Rho(r), a_op))
-				if (logs['n']):
-					# Store expectation values of n
-					for r in range(0, L):
-						self.n_avg[r,ind] = np.real(np.trace(np.dot(self.Single_Site_Rho(r), n_op)))
-
-			# Can delete this later:
-			if (i % 50 == 0):
-				print "step {0} done".format(i)
+				# Log data:
+				if (i % (logs['skip'] + 1) == 0):
+					ind = int(i / (logs['skip'] + 1))
+					# (the bonds of the last layer have measured their energies)
+					with profiling.Phase(self.profile, 'measure'):
+						self.Measure(ind, ops, [l for (V, l) in layers[-1]])
+
+				if (next_ops is not ops):
+					ops = next_ops
+					layers = [ops.Layer(parity, frac) for (parity, frac) in schedule]
+					if (fuse):
+						fused = ops.Layer(schedule[-1][0], schedule[-1][1] + schedule[0][1])
+					if (logs.get('E', False)):
+						self.H_bond = [ops.H[ops.Bond_Kind(l)] for l in range(0, L-1)]
+
+				self.step = i
+				if (save):
+					with profiling.Phase(self.profile, 'checkpoint'):
+						self.Save_Checkpoint(checkpoint)
+					last_save = time.time()
+				if (self.callback is not None and split):
+					self.callback(self, i)
+
+				# Can delete this later:
+				if (i % 50 == 0):
+					print "step {0} done".format(i)
+
+			if (self.sink is not None):
+				self.sink.Close()
+		finally:
+			if (pool is not None):
+				pool.terminate()
+				pool.join()
+			Restore_BLAS(blas)
+		self.Finish_Profile()
+
+	# Operators for iteration i (from time (i-1) * delta to i * delta),
+	# with the ramped parameters at the midpoint of the step
+	# (from a cache of the last sim['ramp_cache'] sets, default 4, with ramps)
+	def Step_Operators(self, i):
+		model = Model_At(self.model, self.sim, (i - 0.5) * self.sim['delta'])
+		if (not self.model.get('ramp')):
+			return gates.Cached_Operators(Operators, model, self.sim)
+		if (self.ramp_cache is None):
+			self.ramp_cache = gates.Bounded_Cache(self.sim.get('ramp_cache', 4))
+		return self.ramp_cache.Operators(Operators, model, self.sim)
+
+	# Stop the profile of the run (if any) and print its report
+	def Finish_Profile(self):
+		if (self.profile is not None):
+			self.profile.Finish()
+			print self.profile.Report()
 	
+	# Imaginary time evolution to the ground state of H - mu * N
+	# (mu = sim['mu'] * U, unless sim['sym'] fixes the particle number).
+	# Every sim['check'] iterations the energy and the Schmidt values are
+	# compared with the last check; once both change by less than sim['tol']
+	# per unit of imaginary time, delta is multiplied by sim['anneal'] to
+	# remove the Trotter error, down to sim['delta_min'], where the run stops.
+	# sim['N'] is the largest number of iterations to spend.
+	# Sets self.energy, self.iterations and self.converged,
+	# and logs the final state (as time index 0).
+	def Find_Ground_State(self):
+		N = self.sim['N']
+		# (single precision rounding alone changes the state by ~1E-5
+		# per unit of imaginary time at delta = 1E-3)
+		if (self.sim.get('precision', 'single') == 'double'):
+			tol = self.sim.get('tol', 1E-8)
+		else:
+			tol = self.sim.get('tol', 1E-4)
+		check = self.sim.get('check', 10)
+		anneal = self.sim.get('anneal', 0.1)
+		delta_min = self.sim.get('delta_min', self.sim['delta'] / 100)
+
+		# The gates and the truncation error use self.sim['delta'],
+		# so work on a copy that follows the annealing
+		sim = self.sim
+		self.sim = dict(sim)
+		pool = Layer_Pool(self.sim)
+		blas = Layer_BLAS(self.sim)
+		try:
+			schedule = Schedule(self.sim)
+
+			self.iterations = 0
+			self.converged = False
+			final = (self.sim['delta'] <= delta_min)
+			while (self.iterations < N):
+				delta = self.sim['delta']
+				ops = gates.Cached_Operators(Operators, Model_At(self.model, self.sim, 0), self.sim)
+				layers = [ops.Layer(parity, frac) for (parity, frac) in schedule]
+				energy = self.Energy(ops)
+				while (self.iterations < N):
+					Lambda = list(self.Lambda)
+					for j in range(0, check):
+						for layer in layers:
+							with profiling.Phase(self.profile, 'layers'):
+								self.Update_Layer(layer, pool)
+					self.iterations += check
+					with profiling.Phase(self.profile, 'canonicalize'):
+						self.Canonicalize()
+					with profiling.Phase(self.profile, 'energy'):
+						last, energy = energy, self.Energy(ops)
+					if (self.callback is not None):
+						self.callback(self, self.iterations)
+					# Changes per unit of imaginary time since the last check
+					dE = abs(energy - last) / (check * delta)
+					dS = Spectrum_Change(Lambda, self.Lambda) / (check * delta)
+					if (dE < tol and dS < tol):
+						break
+				else:
+					# Out of iterations before converging at this delta
+					break
+				print "delta = {0}: E = {1} after {2} iterations".format(delta, energy, self.iterations)
+				if (final):
+					self.converged = True
+					break
+				# (with some slack for rounding: 0.1 * 0.1 * 0.1 > 0.001)
+				final = (delta * anneal <= delta_min * (1 + 1E-9))
+				if (final):
+					self.sim['delta'] = delta_min
+				else:
+					self.sim['delta'] = delta * anneal
+			self.energy = self.Energy(ops)
+			self.step = self.iterations
+
+			if (self.converged):
+				print "Ground state: E = {0}, converged after {1} iterations".format(self.energy, self.iterations)
+			else:
+				print "Ground state: E = {0}, not converged after {1} iterations".format(self.energy, self.iterations)
+
+			if (self.sink is not None):
+				self.sink.Truncate(0)
+			with profiling.Phase(self.profile, 'measure'):
+				self.Measure(0, ops)
+			if (self.sink is not None):
+				self.sink.Close()
+		finally:
+			if (pool is not None):
+				pool.terminate()
+				pool.join()
+			Restore_BLAS(blas)
+			self.sim = sim
+		return self.energy
+
+	# Bring the MPS back to the canonical form that Update and Measure
+	# rely on (see Canonical_Form). Needed in imaginary time,
+	# where the gates are not unitary.
+	def Canonicalize(self):
+		if (self.sim.get('sym', False)):
+			charges = self.charges; n_total = self.n_total
+		else:
+			charges = None; n_total = 0
+		self.tensorA, self.Lambda, charges, discarded = Canonical_Form(self.tensorA, charges, n_total, self.sim)
+		if (charges is not None):
+			self.charges = charges
+		self.tau += self.sim['delta'] * discarded
+
+	# Start from the MPS A_0 A_1 ... A_(L-1), given as a list of
+	# (d x chi_(l-1) x chi_l) tensors in any gauge, e.g. a ground state
+	# from dmrg.py as the starting point of a quench. The state is brought
+	# to canonical form; with sim['sym'], every Schmidt state is then
+	# labelled with its particle number (see Number_Labels).
+	def Set_State(self, tensors):
+		cdtype, rdtype = Dtypes(self.sim)
+		A = [np.asarray(M).astype(cdtype) for M in tensors]
+		A, Lambda, charges, discarded = Canonical_Form(A, None, 0, self.sim)
+		if (self.sim.get('sym', False)):
+			A, self.charges, self.n_total = Number_Labels(A, Lambda, self.sim)
+		self.tensorA = A
+		self.Lambda = [x.astype(rdtype) for x in Lambda]
+
+	# Energy <H> of the current state: the sum over bonds of the
+	# expectation value of the two-site Hamiltonian, read off the
+	# two-site wavefunction Theta * Lambda_(l+1) of each bond
+	def Energy(self, ops):
+		return sum([self.Bond_Energy(l, ops) for l in range(0, self.sim['L'] - 1)])
+
+	# Expectation value of the two-site Hamiltonian of bond l
+	def Bond_Energy(self, l, ops):
+		Phi = self.Build_Theta(l)
+		if (l != self.sim['L'] - 2):
+			Phi = Phi * self.Lambda[l+1]
+		return Two_Site_Energy(ops.H[ops.Bond_Kind(l)], Phi)
+
+	# Write the MPS, the truncation error, the iteration count
+	# and the logged data so far to the .npz file path.
+	# The file is written under a temporary name and then renamed,
+	# so an interrupted write never replaces a good checkpoint.
+	def Save_Checkpoint(self, path):
+		L = self.sim['L']
+		data = {'step': self.step, 'tau': self.tau}
+		if (hasattr(self, 'E0')):
+			data['E0'] = self.E0
+		data['bond_discarded'] = self.bond_discarded
+		for k in range(0, L):
+			data['A_{0}'.format(k)] = self.tensorA[k]
+		for l in range(0, L-1):
+			data['Lambda_{0}'.format(l)] = self.Lambda[l]
+		if (self.sim.get('sym', False)):
+			for l in range(0, L-1):
+				data['charges_{0}'.format(l)] = self.charges[l]
+			data['n_total'] = self.n_total
+		if (self.sink is not None):
+			# The logged data is on disk already
+			self.sink.Flush()
+			data['samples'] = self.sink.count
+		else:
+			for name in self.fields:
+				data[name] = getattr(self, name)
+		tmp = path + ".tmp.npz"
+		np.savez(tmp, **data)
+		os.rename(tmp, path)
+
+	# Pick up a run from a file written by Save_Checkpoint;
+	# Run_Simulation then continues with the next iteration.
+	# The logged arrays may be longer than in the saved run (larger N).
+	def Load_Checkpoint(self, path):
+		L = self.sim['L']
+		with np.load(path) as data:
+			self.step = int(data['step'])
+			self.tau = float(data['tau'])
+			if ('E0' in data):
+				self.E0 = float(data['E0'])
+			if ('bond_discarded' in data):
+				self.bond_discarded = data['bond_discarded']
+			self.tensorA = [data['A_{0}'.format(k)] for k in range(0, L)]
+			self.Lambda = [data['Lambda_{0}'.format(l)] for l in range(0, L-1)]
+			if (self.sim.get('sym', False)):
+				self.charges = [data['charges_{0}'.format(l)] for l in range(0, L-1)]
+				self.n_total = int(data['n_total'])
+			if (self.sink is not None):
+				# Drop anything logged after the checkpoint
+				self.sink.Truncate(int(data['samples']))
+			else:
+				for name in self.fields:
+					saved = data[name]
+					out = getattr(self, name)
+					T = min(saved.shape[1], out.shape[1])
+					out[:,0:T] = saved[:,0:T]
+
 	# Build the Theta tensor
 	# This is denoted as Psi-bar in
 	# Urbanek and Soldan equation 16
 	def Build_Theta(self, l):
-		L = self.sim['L']
-		chi = self.sim['chi']
-		Lambda = self.Lambda
-		A_l = self.tensorA[l]
-		A_lp1 = self.tensorA[l+1]
-
-		if (l != self.sim['L']-2):
-			theta = np.tensordot(A_l, A_lp1, axes=(-1,1))
-			# theta = np.tensordot(theta, np.diag(Lambda[l+1]), axes=(-1, 0))
-			theta = np.transpose(theta, (0,2,1,3))
-		elif (l == self.sim['L']-2):
-			theta = np.tensordot(A_l, A_lp1, axes=(-1,1))
-			theta = np.transpose(theta, (0,2,1,3))
-		return theta
+		return Theta_Tensor(self.tensorA[l], self.tensorA[l+1])
 
 	# This follows the discussion in
 	# Urbanek and Soldan section 3.1
 	# Note that while the paper indexes from 1,
 	# we index from zero here to avoid confusion in the code.
 	# Therefore, l runs from [0, ..., L - 1] in our case.
+	# The work is done in Evolve_Bond, which only sees
+	# the tensors on bond l; the results are stored here.
 	def Update(self, V, l):
-		d = self.sim['d']; L = self.sim['L'];
-		chi = self.sim['chi']; delta = self.sim['delta'];
-
-		# Build the appropriate Theta tensor
-		Theta = self.Build_Theta(l)
-		# Apply the unitary matrix V
-		Theta = np.tensordot(V, Theta, axes=([2,3], [0,1]))
-		
-		# Build Phi
+		self.Store_Bond(l, Evolve_Bond(self.Bond_Args(V, l)))
+
+	# Apply all the gates [(V, l), ...] of one Trotter layer.
+	# The bonds of a layer are disjoint, so with a worker pool
+	# they are evolved at the same time and stored afterwards.
+	def Update_Layer(self, layer, pool=None):
+		if (pool is None):
+			for (V, l) in layer:
+				self.Update(V, l)
+		else:
+			results = pool.map(Evolve_Bond, [self.Bond_Args(V, l) for (V, l) in layer])
+			for ((V, l), result) in zip(layer, results):
+				self.Store_Bond(l, result)
+
+	# Everything Evolve_Bond needs to update bond l
+	def Bond_Args(self, V, l):
+		L = self.sim['L']
 		if (l != L - 2):
-			Phi = np.tensordot(Theta, np.diag(self.Lambda[l+1]), axes=(-1,0))
+			Lambda_r = self.Lambda[l+1]
+		else:
+			Lambda_r = None
+		if (self.sim.get('sym', False)):
+			q_row, q_col = self.Block_Charges(l)
 		else:
-			Phi = Theta
+			q_row = None; q_col = None
+		if (self.H_bond is not None):
+			H = self.H_bond[l]
+		else:
+			H = None
+		return (V, self.tensorA[l], self.tensorA[l+1], Lambda_r, q_row, q_col, H, self.sim)
 
-		# Reshape to a square matrix and do singular value decomposition:
-		Phi = Phi / np.linalg.norm(np.absolute(Phi))
-		Phi = np.reshape(np.transpose(Phi, (0,2,1,3)), (d*chi, d*chi))
-		# A and transpose.C contain the new Gamma[l] and Gamma[l+1]
-		# B contains new Lambda[l]
-		A, B, C = np.linalg.svd(Phi)
+	# Store the output of Evolve_Bond for bond l
+	def Store_Bond(self, l, result):
+		A_l, A_lp1, Lambda_l, q, discarded, energy, clock = result
+		self.tensorA[l] = A_l
+		self.tensorA[l+1] = A_lp1
+		self.Lambda[l] = Lambda_l
+		if (q is not None):
+			self.charges[l] = q
+		# Keep track of the truncation error accumulated on this step
+		self.tau += self.sim['delta'] * discarded
+		self.bond_discarded[l] += discarded
+		if (energy is not None):
+			self.bond_energies[l] = energy
+		if (clock is not None and self.profile is not None):
+			self.profile.Merge(clock)
 
-		# Truncate at chi eigenvalues and enforce normalization
-		norm = np.linalg.norm(B[0:chi])
-		self.Lambda[l] = B[0:chi] / norm
-		# print (l, self.Lambda[l])
+	# Particle number labels of the rows and columns of the
+	# (d*chi_l) x (d*chi_r) matrix Phi formed in Update(V, l):
+	# rows are (i_l, a_(l-1)) and count the particles on sites 0, ..., l,
+	# columns are (i_(l+1), a_(l+1)) and count the same thing from the right
+	def Block_Charges(self, l):
+		d = self.sim['d']; L = self.sim['L']
+		if (l != 0):
+			q_left = self.charges[l-1]
+		else:
+			q_left = np.zeros(1, dtype=int)
+		if (l != L - 2):
+			q_right = self.charges[l+1]
+		else:
+			q_right = np.array([self.n_total])
+		q_row = np.reshape(np.arange(d)[:, None] + q_left[None, :], -1)
+		q_col = np.reshape(q_right[None, :] - np.arange(d)[:, None], -1)
+		return q_row, q_col
 
-		# Keep track of the truncation error accumulated on this step
-		self.tau += delta * (1 - norm**2)
+	# Log everything requested in self.logs at time index ind.
+	# The reduced density matrices of all sites are built once,
+	# and all local observables are read off them with one einsum.
+	# Bond energies are only computed here for bonds that are not in
+	# measured, the bonds whose energies Evolve_Bond has just found.
+	# When streaming to a sink, the data goes through column 0.
+	def Measure(self, ind, ops, measured=()):
+		logs = self.logs
+		if (self.sink is not None):
+			slot = 0
+		else:
+			slot = ind
+		rhos = self.Site_Rhos()
+		if (self.profile is not None):
+			self.profile.Allocated(rhos)
+		if (logs['rho']):
+			# Store single particle density matrices
+			self.rhos[:,slot] = rhos
 
-		# Find the new A_l's:
-		# A_l:
-		A_l = np.reshape(A[:, 0:chi], (d, chi, chi))
-		self.tensorA[l] = A_l
+		# Stack the requested operators and the arrays they go into
+		observables = []
+		if (logs['a']):
+			observables.append((ops.a, 'a_avg'))
+		if (logs['n']):
+			observables.append((ops.n_op, 'n_avg'))
+		if (logs.get('n2', False)):
+			observables.append((np.dot(ops.n_op, ops.n_op), 'n2_avg'))
 
-		# A_(l+1):
-		# See Urbanek and Soldan eq. 19
-		A_l_dag = np.transpose(np.conjugate(A_l), (0,2,1))
-		A_lp1 = np.transpose(np.tensordot(A_l_dag, Theta, axes=([0,-1],[0,2])), (1,0,2))
-		self.tensorA[l+1] = A_lp1
+		if (len(observables) != 0):
+			# values[m, k] = tr(rho_k O_m)
+			O = np.array([op for (op, name) in observables])
+			values = np.einsum('kst,mts->mk', rhos, O)
+			if (self.profile is not None):
+				self.profile.Allocated(O, values)
+			for m in range(0, len(observables)):
+				out = getattr(self, observables[m][1])
+				if (np.iscomplexobj(out)):
+					out[:,slot] = values[m]
+				else:
+					out[:,slot] = np.real(values[m])
+
+		if (logs.get('aa', False)):
+			self.aa[:,slot], self.nn[:,slot] = self.Correlations(ops, rhos)
+
+		if (logs.get('E', False)):
+			for l in range(0, self.sim['L'] - 1):
+				if (l not in measured):
+					self.bond_energies[l] = self.Bond_Energy(l, ops)
+			self.E_bond[:,slot] = self.bond_energies
+			self.energy = np.sum(self.bond_energies)
+			if (ind == 0):
+				self.E0 = self.energy
+
+		if (logs.get('S', False) or len(logs.get('renyi', ())) != 0 or logs.get('schmidt', 0) != 0):
+			self.Log_Spectrum(slot)
+
+		if (self.sink is not None):
+			fields = {}
+			if (logs['rho']):
+				fields['rhos'] = self.rhos[:,0]
+			if (logs.get('E', False)):
+				fields['E_bond'] = self.E_bond[:,0]
+			if (logs.get('aa', False)):
+				fields['aa'] = self.aa[:,0]
+				fields['nn'] = self.nn[:,0]
+			if (logs.get('S', False)):
+				fields['S'] = self.S[:,0]
+				fields['discarded'] = self.discarded[:,0]
+			if (len(logs.get('renyi', ())) != 0):
+				fields['S_renyi'] = self.S_renyi[:,0]
+			if (logs.get('schmidt', 0) != 0):
+				fields['schmidt'] = self.schmidt[:,0]
+			for (op, name) in observables:
+				fields[name] = getattr(self, name)[:,0]
+			self.sink.Append(fields)
+
+	# Log the entanglement of every bond into column slot,
+	# straight from the stored Schmidt values (see Entropies)
+	def Log_Spectrum(self, slot):
+		logs = self.logs
+		alphas = logs.get('renyi', ())
+		k = logs.get('schmidt', 0)
+		for l in range(0, self.sim['L'] - 1):
+			S, S_renyi = Entropies(self.Lambda[l], alphas)
+			if (logs.get('S', False)):
+				self.S[l,slot] = S
+				self.discarded[l,slot] = self.bond_discarded[l]
+			self.S_renyi[l,slot] = S_renyi
+			chi = min(k, len(self.Lambda[l]))
+			self.schmidt[l,slot,0:chi] = self.Lambda[l][0:chi]
+		# Start counting again for the next logged step
+		self.bond_discarded[:] = 0
+
+	# Reduced density matrices of all sites, shape (L, d, d).
+	# Sites whose A tensors have the same shape (e.g. the whole bulk
+	# once the bond dimension saturates at chi) are done in one einsum.
+	def Site_Rhos(self):
+		L = self.sim['L']; d = self.sim['d']
+		rhos = np.zeros((L, d, d), dtype=Dtypes(self.sim)[0])
+		groups = {}
+		for k in range(0, L):
+			groups.setdefault(self.tensorA[k].shape, []).append(k)
+		for sites in groups.values():
+			A_k = np.array([self.tensorA[k] for k in sites])
+			# Squared Schmidt values on the bond to the right of each site
+			W = np.array([self.Right_Weights(k) for k in sites])
+			rhos[sites] = np.einsum('ksab,ktab,kb->kst', A_k, np.conjugate(A_k), W)
+		return rhos
+
+	# All-pairs correlations: the L x L matrices <a^dag_i a_j> and
+	# <n_i n_j>, from the site density matrices rhos (see Site_Rhos)
+	# and one transfer sweep from each site i to the right (Correlation_Matrix)
+	def Correlations(self, ops, rhos):
+		L = self.sim['L']
+		W = [self.Right_Weights(k) for k in range(0, L)]
+		aa, nn = Correlation_Matrix(self.tensorA, W, [(ops.a_dag, ops.a), (ops.n_op, ops.n_op)])
+		# On the diagonal: <n_i> and <n_i^2>
+		for i in range(0, L):
+			aa[i,i] = np.trace(np.dot(rhos[i], ops.n_op))
+			nn[i,i] = np.real(np.trace(np.dot(rhos[i], np.dot(ops.n_op, ops.n_op))))
+		return aa, np.real(nn)
+
+	# Squared Schmidt values on the bond to the right of site k
+	# (the last site has a single trivial bond)
+	def Right_Weights(self, k):
+		if (k != self.sim['L'] - 1):
+			return np.absolute(self.Lambda[k])**2
+		else:
+			return np.ones(1)
 
 	# Calculate the reduced density matrix,
 	# tracing over all sites except site k
@@ -187,18 +675,14 @@ class TEBD(object):
 		Lambda = self.Lambda
 		A_k = self.tensorA[k]
 
-		# Need to treat boundaries differently...
+		# Need to treat the last site differently...
 		# See Mishmash thesis pg. 73 for formulas
 		# Note that this is modified since we're storing
-		# A_l tensors, not Gamma_l tensors
-		if (k != 0 and k != L - 1):
+		# A_l tensors, not Gamma_l tensors, so the bond
+		# to the right of site k carries all the weights
+		if (k != L - 1):
 			Rho_L = np.tensordot(np.conjugate(A_k), np.diag(Lambda[k]), axes=(-1,0))
-			Rho_R = np.tensordot(A_k, np.diag(Lambda[k,:]), axes=(-1,0))
-			Rho = np.tensordot(Rho_L, Rho_R, axes=([1,-1],[1,-1]))
-			Rho = np.transpose(Rho)
-		elif (k == 0):
-			Rho_L = np.tensordot(np.conjugate(A_k), np.diag(Lambda[k+1,:]), axes=(-1,0))
-			Rho_R = np.tensordot(A_k, np.diag(Lambda[k+1,:]), axes=(-1,0))
+			Rho_R = np.tensordot(A_k, np.diag(Lambda[k]), axes=(-1,0))
 			Rho = np.tensordot(Rho_L, Rho_R, axes=([1,-1],[1,-1]))
 			Rho = np.transpose(Rho)
 		elif (k == L - 1):
@@ -212,38 +696,154 @@ class Operators(object):
 		# Set up ladder operators	
 		d = sim['d']
 		L = sim['L']
-		a = np.zeros((d,d), dtype=np.complex64)
+		# The ladder operators and the Hamiltonian are real;
+		# only the gates exp(-i delta H) are complex
+		cdtype, rdtype = Dtypes(sim)
+		self.cdtype = cdtype
+		a = np.zeros((d,d), dtype=rdtype)
 		for i in range(0,d-1):
 			a[i, i+1] = math.sqrt(i+1)
 		a_dag = np.transpose(a)
 		n_op = np.dot(a_dag, a)
+		I = np.identity(d, dtype=rdtype)
 
 		self.a = a
 		self.a_dag = a_dag
 		self.n_op = n_op
 	
-		# Set up Hamiltonian
+		# Set up Hamiltonian: J is a number or one value per bond (L-1),
+		# U and the local chemical potential mu (a term -mu_i n_i, e.g. a
+		# trap, superlattice or disorder) a number or one value per site (L)
 		J = model['J']; U = model['U']; delta = sim['delta']
+		mu_site = model.get('mu_site', 0)
+		# Any site dependence: a different Hamiltonian on every bond
+		self.site_dependent = not (np.isscalar(J) and np.isscalar(U) and np.isscalar(mu_site))
+
+		# Imaginary time (sim['it']): the gates are exp(-delta * H), and
+		# a chemical potential mu (in units of U) sets the filling
+		self.it = sim.get('it', False)
+		if (self.it):
+			mu_it = sim.get('mu', 0)
+		else:
+			mu_it = 0
+		self.L = L; self.d = d; self.delta = delta
+		self.gates = {}
+
+		if (self.site_dependent):
+			# Every bond is its own kind (see Bond_Kind): all L-1 two-site
+			# Hamiltonians are built as one stack and diagonalized at once
+			J = Site_Values(J, L-1, 'J'); U = Site_Values(U, L, 'U')
+			mu = Site_Values(mu_site, L, 'mu_site') + mu_it * U
+			h_site = (U[:, None, None] / 2) * np.dot(n_op, n_op - I) - mu[:, None, None] * n_op
+			# Each site's onsite term is split between its two bonds
+			share = np.full(L, 0.5)
+			share[0] = share[L-1] = 1
+			hop = np.kron(a_dag, a) + np.kron(a, a_dag)
+			H = -J[:, None, None] * hop + \
+				np.einsum('lij,km->likjm', share[0:L-1, None, None] * h_site[0:L-1], I).reshape(L-1, d*d, d*d) + \
+				np.einsum('ik,ljm->lijkm', I, share[1:L, None, None] * h_site[1:L]).reshape(L-1, d*d, d*d)
+			H = H.astype(rdtype)
+			w, v = np.linalg.eigh(H)
+			self.H = dict(enumerate(H))
+			self.eigs = dict([(l, (w[l], v[l])) for l in range(0, L-1)])
+			return
+
+		# (as floats: an integer U, e.g. from a JSON spec, would otherwise
+		# be halved by integer division)
+		J = float(J); U = float(U)
+		mu = float(mu_site) + mu_it * U
 
 		# Build two site Hamiltonian:
+		# every site belongs to two bonds, except at the edges
+		h_site = (U / 2) * np.dot(n_op, n_op - I) - mu * n_op
 		hop = -J * (np.kron(a_dag, a) + np.kron(a, a_dag))
-		onsite = (U / 4) * np.kron(np.dot(n_op, n_op - np.identity(d)), np.identity(d)) + (U / 4) * np.kron(np.identity(d), np.dot(n_op, n_op - np.identity(d)))
-		H_2site = hop + onsite
-		H_0 = H_2site + (U / 4) * np.kron(np.dot(n_op, n_op - np.identity(d)), np.identity(d))
-		H_Lm2 = H_2site + (U / 4) * np.kron(np.identity(d), np.dot(n_op, n_op - np.identity(d)))
-		# Diagonalize 
-		w,v = np.linalg.eigh(H_2site)
-		# Create the (d x d x d x d) unitary operator
-		self.V_odd = np.reshape(np.dot(np.dot(v,np.diag(np.exp(-1j*delta*(w) / 2))), np.transpose(v)), (d,d,d,d))
-		self.V_even = np.reshape(np.dot(np.dot(v,np.diag(np.exp(-1j*delta*(w)))), np.transpose(v)), (d,d,d,d))
+		onsite = np.kron(h_site / 2, I) + np.kron(I, h_site / 2)
+		H_2site = (hop + onsite).astype(rdtype)
+		H_0 = H_2site + np.kron(h_site / 2, I)
+		H_Lm2 = H_2site + np.kron(I, h_site / 2)
+		self.H = {'bulk': H_2site, 'first': H_0, 'last': H_Lm2}
+		# Diagonalize once for each kind of bond;
+		# Gate builds the unitaries from these for any time step
+		self.eigs = {'bulk': np.linalg.eigh(H_2site), 'first': np.linalg.eigh(H_0), 'last': np.linalg.eigh(H_Lm2)}
+		# With only two sites, the one bond carries both edges
+		if (L == 2):
+			self.H['both'] = H_0 + H_Lm2 - H_2site
+			self.eigs['both'] = np.linalg.eigh(self.H['both'])
+
+		# Create the (d x d x d x d) unitary operators
+		self.V_odd = self.Gate('bulk', 0.5)
+		self.V_even = self.Gate('bulk', 1)
 		# Do the same for V_0, V_{L-2}
-		w0, v0 = np.linalg.eigh(H_0)
-		self.V_0 = np.reshape(np.dot(np.dot(v0,np.diag(np.exp(-1j*delta*(w0)))), np.transpose(v0)), (d,d,d,d))
-		w_Lm2, v_Lm2 = np.linalg.eigh(H_Lm2)
+		self.V_0 = self.Gate('first', 1)
 		if (L - 2) % 2 == 0:
-			self.V_Lm2 = np.reshape(np.dot(np.dot(v_Lm2,np.diag(np.exp(-1j*delta*(w_Lm2)))), np.transpose(v_Lm2)), (d,d,d,d))
+			self.V_Lm2 = self.Gate('last', 1)
 		else:
-			self.V_Lm2 = np.reshape(np.dot(np.dot(v_Lm2,np.diag(np.exp(-1j*delta*(w_Lm2) / 2))), np.transpose(v_Lm2)), (d,d,d,d))
+			self.V_Lm2 = self.Gate('last', 0.5)
+
+	# exp(-i * frac * delta * H) as a (d x d x d x d) tensor, where H is
+	# the two-site Hamiltonian of the given kind of bond
+	# ('bulk', 'first', 'last' or 'both'; the bond l itself for
+	# site-dependent models); built once per (kind, frac).
+	# In imaginary time this is exp(-frac * delta * H) instead.
+	def Gate(self, kind, frac):
+		if ((kind, frac) not in self.gates):
+			w, v = self.eigs[kind]
+			self.gates[(kind, frac)] = self.Propagators(w[None, :], v[None, :, :], frac)[0]
+		return self.gates[(kind, frac)]
+
+	# Gates of a stack of diagonalized Hamiltonians (w[k], v[k]),
+	# as in Gate, with one batched product
+	def Propagators(self, w, v, frac):
+		d = self.d
+		if (self.it):
+			phases = np.exp(-frac*self.delta*w)
+		else:
+			phases = np.exp(-1j*frac*self.delta*w)
+		V = np.matmul(v * phases[:, None, :], np.transpose(v, (0,2,1)))
+		return np.reshape(V.astype(self.cdtype), (len(w), d, d, d, d))
+
+	# Kind of two-site Hamiltonian acting on bond l:
+	# the first and last bonds also carry the edge sites' onsite terms
+	# (every bond has its own with site-dependent parameters)
+	def Bond_Kind(self, l):
+		L = self.L
+		if (self.site_dependent):
+			return l
+		elif (l == 0 and l == L - 2):
+			return 'both'
+		elif (l == 0):
+			return 'first'
+		elif (l == L - 2):
+			return 'last'
+		else:
+			return 'bulk'
+
+	# Gates [(V, l), ...] evolving every odd (parity = 1)
+	# or even (parity = 0) bond by frac * delta
+	def Layer(self, parity, frac):
+		bonds = range(parity, self.L - 1, 2)
+		# Site-dependent gates missing from a layer are all built at once
+		missing = [l for l in bonds if (self.Bond_Kind(l), frac) not in self.gates]
+		if (self.site_dependent and len(missing) > 0):
+			w = np.array([self.eigs[l][0] for l in missing])
+			v = np.array([self.eigs[l][1] for l in missing])
+			V = self.Propagators(w, v, frac)
+			for k in range(0, len(missing)):
+				self.gates[(missing[k], frac)] = V[k]
+		layer = []
+		for l in bonds:
+			layer.append((self.Gate(self.Bond_Kind(l), frac), l))
+		return layer
+
+# A model parameter as one value per site (or bond): a number is the same
+# everywhere, a list or array must have n values
+def Site_Values(value, n, name):
+	values = np.array(value, dtype=np.float64)
+	if (values.ndim == 0):
+		return np.full(n, float(values))
+	if (values.shape != (n,)):
+		raise ValueError("model['{0}'] needs {1} values, not {2}".format(name, n, values.shape))
+	return values
 
 # Helper functions for initialization:
 
@@ -255,6 +855,7 @@ class Operators(object):
 # 		if not, initialize w/ probability (n_onsite - floor(n_onsite))
 # flag = 1: approximate coherent state with alpha = sqrt(n_onsite)
 # flag = 2: put floor(nbar) particles on 'site'
+# init['seed'] fixes the random occupations (see Random_Numbers)
 def Initialize_States(sim, init):
 	n_max = sim['d']
 	L = sim['L']
@@ -263,14 +864,14 @@ def Initialize_States(sim, init):
 	site = init['site']
 
 	# Initialize a matrix of zeros
-	mat = np.zeros((L, n_max), dtype=np.complex64)
+	mat = np.zeros((L, n_max), dtype=Dtypes(sim)[0])
 
 	# If not coherent states
 	if (flag == 0):
 		if (math.floor(n_onsite) >= 0):
 			# Check that you're under the number cutoff
 			if (math.floor(n_onsite) < n_max):
-				mat[:,math.floor(n_onsite)] = 1.0
+				mat[:,int(math.floor(n_onsite))] = 1.0
 			# If not, initialize to vacuum
 			else:
 				return mat
@@ -278,7 +879,7 @@ def Initialize_States(sim, init):
 			# Check for fractional occupation
 			if (n_onsite != math.floor(n_onsite)):
 				filling = n_onsite - math.floor(n_onsite)
-				rands = np.random.rand(L)
+				rands = Random_Numbers(init, L)
 				# Populate next highest state with probability = filling
 				for i in range(0, L):
 					if rands[i] < filling:
@@ -302,26 +903,530 @@ def Initialize_States(sim, init):
 		if (math.floor(n_onsite) < n_max):
 			mat[:, 0] = 1.0
 			mat[site, 0] = 0.0
-			mat[site,math.floor(n_onsite)] = 1.0
+			mat[site,int(math.floor(n_onsite))] = 1.0
 	return mat
 
+# n uniform random numbers in [0, 1) for a random initial state:
+# from a generator seeded with init['seed'], so that the same seed gives
+# the same configuration in every process, or from the global numpy
+# generator without a seed
+def Random_Numbers(init, n):
+	if (init.get('seed') is None):
+		return np.random.rand(n)
+	return np.random.RandomState(init['seed']).rand(n)
+
+# Does init describe a random initial state (a sample of an ensemble)?
+def Random_State(init):
+	return init['flag'] == 0 and init['nbar'] != math.floor(init['nbar'])
+
+# Numeric precision of a run, set by sim['precision']:
+# 'single' (default) or 'double'.
+# Returns the dtypes for complex data (the MPS tensors, gates and
+# density matrices) and for real data (Schmidt values, operators, Hamiltonians).
+def Dtypes(sim):
+	if (sim.get('precision', 'single') == 'double'):
+		return np.complex128, np.float64
+	else:
+		return np.complex64, np.float32
+
 # Initialize the coefficient tensors
 # See Mishmash Appendix A, assuming product wavefunctions
-# Important not to inadverdently cast to real numbers instead of complex!
+# Important not to inadverdently cast the Gammas to real numbers instead of complex!
+# The Schmidt values (Lambdas) are real.
+# Bond dimensions start at 1 (a product state has a single Schmidt value
+# on every bond) and grow in Update up to the cap sim['chi'].
 def lambda0(sim):
-	L = sim['L']; chi = sim['chi']
+	L = sim['L']
 	# From Appendix A, pg. 173
-	mat = np.zeros((L-1, chi), dtype=np.complex64)
-	mat[:,0] = 1.0
-	return mat
+	Lambda = []
+	for i in range(0, L-1):
+		Lambda.append(np.ones(1, dtype=Dtypes(sim)[1]))
+	return Lambda
 
 # From Appendix A, pg. 173
 def Gamma0(coeffs, sim):
-	d = sim['d']; L = sim['L']; chi = sim['chi']
+	d = sim['d']; L = sim['L']
 	Gamma = []
 
 	for i in range(0, L):
-		mat = np.zeros((d, chi, chi), dtype=np.complex64)
+		mat = np.zeros((d, 1, 1), dtype=Dtypes(sim)[0])
 		mat[:, 0, 0] = coeffs[i,:]
 		Gamma.append(mat)
 	return Gamma
+
+# Particle number labels of the initial Schmidt values:
+# bond l carries the number of particles on sites 0, ..., l.
+# Also returns the total number of particles on the chain.
+# Only Fock product states (init['flag'] = 0 or 2) have definite labels.
+def Charges0(coeffs, sim):
+	L = sim['L']
+	occupations = np.zeros(L, dtype=int)
+	for i in range(0, L):
+		if (np.count_nonzero(coeffs[i,:]) != 1):
+			raise ValueError("sim['sym'] needs a Fock initial state, site {0} has no definite number".format(i))
+		occupations[i] = np.argmax(np.absolute(coeffs[i,:]))
+	charges = []
+	for i in range(0, L-1):
+		charges.append(np.array([np.sum(occupations[0:i+1])]))
+	return charges, int(np.sum(occupations))
+
+# Singular value decomposition of a matrix that is block diagonal
+# in the particle number: Phi[r, c] vanishes unless q_row[r] == q_col[c].
+# Each charge block is decomposed on its own, and the singular values of
+# all blocks are merged in decreasing order, as np.linalg.svd would return them.
+# Returns the left singular vectors (scattered back into full rows),
+# the singular values and their particle number labels.
+def Block_SVD(Phi, q_row, q_col):
+	blocks = []
+	for q in np.intersect1d(q_row, q_col):
+		rows = np.nonzero(q_row == q)[0]
+		cols = np.nonzero(q_col == q)[0]
+		u, s, v = np.linalg.svd(Phi[np.ix_(rows, cols)], full_matrices=False)
+		blocks.append((q, rows, u, s))
+
+	k = sum([len(s) for (q, rows, u, s) in blocks])
+	A = np.zeros((Phi.shape[0], k), dtype=Phi.dtype)
+	B = np.zeros(k, dtype=np.finfo(Phi.dtype).dtype)
+	charges = np.zeros(k, dtype=int)
+	j = 0
+	for (q, rows, u, s) in blocks:
+		A[rows, j:j+len(s)] = u
+		B[j:j+len(s)] = s
+		charges[j:j+len(s)] = q
+		j += len(s)
+
+	# Sort all singular values in decreasing order
+	order = np.argsort(-B, kind='mergesort')
+	return A[:, order], B[order], charges[order]
+
+# Left singular vectors, singular values and their particle number
+# labels (None without charges) of the matrix M. With charges, M is
+# block diagonal in the particle number to the left of the bond,
+# so it is decomposed one charge block at a time.
+def Left_SVD(M, q_row, q_col):
+	if (q_row is not None):
+		return Block_SVD(M, q_row, q_col)
+	U, S, V = np.linalg.svd(M, full_matrices=False)
+	return U, S, None
+
+# Build the Theta tensor from A_l and A_(l+1)
+# This is denoted as Psi-bar in
+# Urbanek and Soldan equation 16
+# Indices are [i_l, i_(l+1), a_(l-1), a_(l+1)]
+def Theta_Tensor(A_l, A_lp1):
+	theta = np.tensordot(A_l, A_lp1, axes=(-1,1))
+	theta = np.transpose(theta, (0,2,1,3))
+	return theta
+
+# Apply the two-site gate V to one bond and split the result again
+# (Urbanek and Soldan section 3.1).
+# args = (V, A_l, A_(l+1), Lambda_(l+1), q_row, q_col, H, sim),
+# where Lambda_(l+1) is None on the last bond, the charges are None
+# unless sim['sym'] is set (see TEBD.Block_Charges), and H is the
+# two-site Hamiltonian of the bond, or None to skip measuring its energy.
+# Returns the new (A_l, A_(l+1), Lambda_l, charges of Lambda_l,
+# discarded weight, energy of the bond after the gate, and with
+# sim['profile'] the time spent in each phase as a profiling.Clock).
+# This is a plain function of its arguments so that the
+# bonds of a layer can be handed to a pool of workers.
+def Evolve_Bond(args):
+	V, A_l, A_lp1, Lambda_r, q_row, q_col, H, sim = args
+	d = sim['d']
+	# Time every phase with sim['profile']
+	if (sim.get('profile')):
+		clock = profiling.Clock(memory=(sim['profile'] == 'memory'))
+	else:
+		clock = None
+
+	# Build the appropriate Theta tensor
+	Theta = Theta_Tensor(A_l, A_lp1)
+	if (clock is not None):
+		clock.Lap('theta')
+	# Apply the unitary matrix V
+	Theta = np.tensordot(V, Theta, axes=([2,3], [0,1]))
+	if (clock is not None):
+		clock.Lap('gate')
+		clock.Allocated(Theta)
+	# Bond dimensions to the left of site l and to the right of site l+1
+	chi_l = Theta.shape[2]; chi_r = Theta.shape[3]
+
+	# Build Phi (Theta times the real Schmidt values on bond l+1)
+	if (Lambda_r is not None):
+		Phi = Theta * Lambda_r
+	else:
+		Phi = Theta
+
+	# Reshape to a (d*chi_l) x (d*chi_r) matrix and do singular value decomposition:
+	# (the gates are not unitary in imaginary time, so Theta is normalized too)
+	norm = np.linalg.norm(Phi)
+	Phi = Phi / norm
+	Theta = Theta / norm
+	if (clock is not None):
+		clock.Lap('reshape')
+		clock.Allocated(Phi, Theta)
+	# Phi is the two-site wavefunction of the bond, so its energy comes for free
+	if (H is not None):
+		energy = Two_Site_Energy(H, Phi)
+		if (clock is not None):
+			clock.Lap('energy')
+	else:
+		energy = None
+	Phi = np.reshape(np.transpose(Phi, (0,2,1,3)), (d*chi_l, d*chi_r))
+	if (clock is not None):
+		clock.Lap('reshape')
+		clock.Allocated(Phi)
+	# A and transpose.C contain the new Gamma[l] and Gamma[l+1]
+	# B contains new Lambda[l]
+	A, B, q = Left_SVD(Phi, q_row, q_col)
+	if (clock is not None):
+		clock.Lap('svd')
+		clock.Count('bond updates')
+		clock.Count('SVD matrix elements', Phi.size)
+		clock.Allocated(A, B)
+
+	# Truncate to the new bond dimension and enforce normalization
+	chi = Bond_Dimension(B, sim)
+	norm = np.linalg.norm(B[0:chi])
+	Lambda_l = B[0:chi] / norm
+	if (q is not None):
+		q = q[0:chi]
+	# Truncation error 1 - norm**2, summed directly so that it stays
+	# accurate (and non-negative) in single precision
+	weights = np.absolute(B).astype(np.float64)**2
+	discarded = np.sum(weights[chi:]) / np.sum(weights)
+	if (clock is not None):
+		clock.Lap('truncate')
+
+	# Find the new A_l's:
+	# A_l:
+	A_l = np.reshape(A[:, 0:chi], (d, chi_l, chi))
+
+	# A_(l+1):
+	# See Urbanek and Soldan eq. 19
+	A_l_dag = np.transpose(np.conjugate(A_l), (0,2,1))
+	A_lp1 = np.transpose(np.tensordot(A_l_dag, Theta, axes=([0,-1],[0,2])), (1,0,2))
+
+	if (clock is not None):
+		clock.Lap('split')
+		clock.Allocated(A_lp1)
+		# (A_l is a view of A unless the bond was truncated)
+		if (not np.may_share_memory(A_l, A)):
+			clock.Allocated(A_l)
+	return A_l, A_lp1, Lambda_l, q, discarded, energy, clock
+
+# <Phi|H|Phi> / <Phi|Phi> for the (d*d x d*d) two-site Hamiltonian H and the
+# two-site wavefunction Phi, indices [i_l, i_(l+1), a_(l-1), a_(l+1)]
+def Two_Site_Energy(H, Phi):
+	d = Phi.shape[0]
+	H_Phi = np.tensordot(np.reshape(H, (d,d,d,d)), Phi, axes=([2,3], [0,1]))
+	return np.real(np.vdot(Phi, H_Phi)) / np.real(np.vdot(Phi, Phi))
+
+# Von Neumann entropy -sum p log p and Renyi entropies
+# log(sum p^alpha) / (1 - alpha), for each alpha in alphas, of the
+# probabilities p = Lambda**2 of the (normalized) Schmidt values Lambda.
+# Natural logarithms; alpha = 1 gives the von Neumann entropy again.
+def Entropies(Lambda, alphas=()):
+	p = np.absolute(Lambda).astype(np.float64)**2
+	p = p[p > 0]
+	S = -np.sum(p * np.log(p))
+	S_renyi = np.zeros(len(alphas))
+	for m in range(0, len(alphas)):
+		if (alphas[m] == 1):
+			S_renyi[m] = S
+		else:
+			S_renyi[m] = np.log(np.sum(p**alphas[m])) / (1 - alphas[m])
+	return S, S_renyi
+
+# Correlations <O_i P_j> for every pair i < j and every pair of operators
+# (O, P) in pairs, for an MPS A_0 A_1 ... A_(L-1) of left-orthonormal tensors
+# with the squared Schmidt values W_k on the bond to the right of each site
+# (as in TEBD.Site_Rhos). For each i, the transfer matrices of sites
+# i+1, i+2, ... are applied to the partial contraction of sites up to i
+# once for all j, so the whole matrix costs O(L^2 d chi^3).
+# Returns one L x L matrix per pair, filled in for i != j
+# (the lower triangle from C[j, i] = <P_j^dag O_i^dag>* = C[i, j]* for
+# Hermitian pairs like (a^dag, a) and (n, n)); the diagonal is left at zero.
+def Correlation_Matrix(A, W, pairs):
+	L = len(A)
+	m = len(pairs)
+	O = np.array([pair[0] for pair in pairs])
+	P = np.array([pair[1] for pair in pairs])
+	C = np.zeros((m, L, L), dtype=np.result_type(A[0], O))
+	for i in range(0, L-1):
+		# E[m, a', a]: sites 0, ..., i with O_i, bra index first
+		E = np.tensordot(np.conjugate(A[i]), np.tensordot(O, A[i], axes=(2,0)), axes=([0,1],[1,2]))
+		E = np.transpose(E, (1,0,2))
+		for j in range(i+1, L):
+			# Y[m, a, s, c] = E A_j^*, shared by both steps below
+			Y = np.tensordot(E, np.conjugate(A[j]), axes=(1,1))
+			# Close with P_j and the weights to the right of j
+			X = np.tensordot(P, A[j], axes=(2,0)) * W[j]
+			C[:, i, j] = np.einsum('mbsc,msbc->m', Y, X)
+			# Move on through the transfer matrix of site j
+			if (j != L - 1):
+				E = np.tensordot(Y, A[j], axes=([1,2],[1,0]))
+	C = C + np.conjugate(np.transpose(C, (0,2,1)))
+	return list(C)
+
+# Momentum distribution n(k) = (1/L) sum_ij exp(i k (x_i - x_j)) <a^dag_i a_j>
+# for the L x L matrix aa = <a^dag_i a_j> (e.g. TEBD.aa[:, t]) at the momenta ks
+def Momentum_Distribution(aa, ks):
+	L = aa.shape[0]
+	phases = np.exp(1j * np.outer(ks, np.arange(L)))
+	return np.real(np.einsum('ki,ij,kj->k', phases, aa, np.conjugate(phases))) / L
+
+# Condensate fraction: the largest eigenvalue of <a^dag_i a_j>
+# over the number of particles (its trace)
+def Condensate_Fraction(aa):
+	w = np.linalg.eigvalsh(aa)
+	return w[-1] / np.real(np.trace(aa))
+
+# Canonical form of the MPS A_0 A_1 ... A_(L-1) (a list of
+# (d x chi_(l-1) x chi_l) tensors in any gauge): a sweep from the left
+# makes every A_l left-orthonormal, and a sweep from the right then finds
+# the Schmidt values of every bond (truncated as in Evolve_Bond) and
+# rotates each A_l into the same basis, without dividing by Schmidt values.
+# With charges (the particle numbers of the bonds of A, and the total
+# n_total), the decompositions are done one charge block at a time.
+# Returns the new A_l's, Lambda_l's, charges (None without) and the
+# discarded weight.
+def Canonical_Form(A, charges, n_total, sim):
+	d = sim['d']; L = sim['L']
+	A = list(A)
+
+	# Left to right
+	q_row = None; q_col = None
+	q_left = np.zeros(1, dtype=int)
+	left_charges = []
+	for l in range(0, L-1):
+		chi_l = A[l].shape[1]
+		M = np.reshape(A[l], (d*chi_l, A[l].shape[2]))
+		if (charges is not None):
+			q_row = np.reshape(np.arange(d)[:, None] + q_left[None, :], -1)
+			q_col = charges[l]
+		U, S, q_left = Left_SVD(M, q_row, q_col)
+		A[l] = np.reshape(U, (d, chi_l, U.shape[1]))
+		R = np.dot(np.conjugate(np.transpose(U)), M)
+		A[l+1] = np.transpose(np.tensordot(R, A[l+1], axes=(1,1)), (1,0,2))
+		left_charges.append(q_left)
+	A[L-1] = A[L-1] / np.linalg.norm(A[L-1])
+
+	# Right to left: D = A_(l+1) U_(l+1) and C = D Lambda_(l+1)
+	# hold the part of the state to the right of bond l
+	Lambda = [None] * (L-1)
+	new_charges = [None] * (L-1)
+	discarded = 0
+	D = A[L-1]; C = D
+	q_right = np.array([n_total])
+	for l in range(L-2, -1, -1):
+		chi_l = C.shape[1]; chi_r = C.shape[2]
+		M = np.reshape(np.transpose(C, (1,0,2)), (chi_l, d*chi_r))
+		if (charges is not None):
+			q_row = left_charges[l]
+			q_col = np.reshape(q_right[None, :] - np.arange(d)[:, None], -1)
+		U, S, q = Left_SVD(M, q_row, q_col)
+		chi = Bond_Dimension(S, sim)
+		weights = np.absolute(S).astype(np.float64)**2
+		discarded += np.sum(weights[chi:]) / np.sum(weights)
+		U = U[:, 0:chi]
+		Lambda[l] = S[0:chi] / np.linalg.norm(S[0:chi])
+		if (charges is not None):
+			new_charges[l] = q[0:chi]
+			q_right = q[0:chi]
+		A[l+1] = np.transpose(np.tensordot(np.conjugate(U), D, axes=(0,1)), (1,0,2))
+		D = np.tensordot(A[l], U, axes=(-1,0))
+		C = D * Lambda[l]
+	A[0] = D
+	if (charges is None):
+		new_charges = None
+	return A, Lambda, new_charges, discarded
+
+# Particle number labels for an MPS in canonical form (from Canonical_Form)
+# with a definite total number, for the particle-number conserving mode.
+# On each bond, the number of particles on sites 0, ..., l is built in the
+# basis of the left Schmidt states and diagonalized; only states with equal
+# Schmidt values are mixed, so the Lambda_l's stay as they are.
+# Returns the rotated A_l's, the charges of every bond and the total number.
+def Number_Labels(A, Lambda, sim):
+	d = sim['d']; L = sim['L']
+	A = list(A)
+	n = np.arange(d)
+	N = np.zeros((1, 1))
+	charges = []
+	for l in range(0, L):
+		A_l = A[l]
+		# Particles on sites 0, ..., l in the basis of the bond to the right of site l
+		N = np.einsum('sab,ac,scd->bd', np.conjugate(A_l), N, A_l) + \
+			np.einsum('s,sab,sad->bd', n, np.conjugate(A_l), A_l)
+		if (l == L - 1):
+			break
+		# Diagonalize within each group of equal Schmidt values
+		V = np.zeros(N.shape, dtype=A_l.dtype)
+		start = 0
+		for k in range(1, len(Lambda[l]) + 1):
+			if (k == len(Lambda[l]) or not np.isclose(Lambda[l][k], Lambda[l][start], rtol=1E-4)):
+				w, v = np.linalg.eigh(N[start:k, start:k])
+				V[start:k, start:k] = v
+				start = k
+		q = np.real(np.einsum('ab,ac,cb->b', np.conjugate(V), N, V))
+		if (np.max(np.absolute(q - np.round(q))) > 1E-3):
+			raise ValueError("sim['sym'] needs a state with a definite particle number, bond {0} has none".format(l))
+		A[l] = np.tensordot(A_l, V, axes=(-1,0))
+		A[l+1] = np.transpose(np.tensordot(np.conjugate(np.transpose(V)), A[l+1], axes=(1,1)), (1,0,2))
+		q = np.round(q).astype(int)
+		N = np.diag(q.astype(float))
+		charges.append(q)
+	return A, charges, int(np.round(np.real(N[0,0])))
+
+# Splitting schemes for exp(-i * delta * (H_odd + H_even)):
+# each is a list of layers (parity, frac), applied left to right, that
+# evolve the odd (parity = 1) or even (parity = 0) bonds by frac * delta.
+# 'trotter2': second order odd-even-odd (Strang) splitting
+# 'forest-ruth': fourth order Forest-Ruth, 3 even layers per step
+# 'suzuki4': fourth order Suzuki fractal S2(p)^2 S2(1 - 4p) S2(p)^2, 5 even layers
+# 'omelyan4': fourth order splitting with optimized error constant
+#	(Omelyan, Mryglod and Folk, Comput. Phys. Commun. 146, 188 (2002)), 4 even layers
+# The fourth order schemes cost 2-3 times more per step than 'trotter2'
+# but reach the same accuracy with a much larger sim['delta'].
+theta = 1.0 / (2.0 - 2.0**(1.0/3))
+p = 1.0 / (4.0 - 4.0**(1.0/3))
+xi = 0.1786178958448091; lam = -0.2123418310626054; chi_o = -0.06626458266981849
+Schedules = {
+	'trotter2': [(1, 0.5), (0, 1.0), (1, 0.5)],
+	'forest-ruth': [(1, theta/2), (0, theta), (1, (1-theta)/2), (0, 1-2*theta),
+		(1, (1-theta)/2), (0, theta), (1, theta/2)],
+	'suzuki4': [(1, p/2), (0, p), (1, p), (0, p), (1, (1-3*p)/2), (0, 1-4*p),
+		(1, (1-3*p)/2), (0, p), (1, p), (0, p), (1, p/2)],
+	'omelyan4': [(1, xi), (0, (1-2*lam)/2), (1, chi_o), (0, lam), (1, 1-2*(chi_o+xi)),
+		(0, lam), (1, chi_o), (0, (1-2*lam)/2), (1, xi)],
+}
+del theta, p, xi, lam, chi_o
+
+# Layers of one time step: sim['schedule'] is the name of one of the
+# Schedules above (default 'trotter2') or a list of (parity, frac) of its own
+def Schedule(sim):
+	schedule = sim.get('schedule', 'trotter2')
+	if (isinstance(schedule, str)):
+		return Schedules[schedule]
+	return [(int(parity), float(frac)) for (parity, frac) in schedule]
+
+# Model parameters at time t. model['ramp'] = {name: ramp, ...} makes the
+# model parameter name (e.g. 'U' or 'J') time dependent; a ramp is either
+# a table [(t_0, value_0), (t_1, value_1), ...], linear in between and
+# constant outside, or a function of t (which cannot be sent to worker
+# processes or cached, see cache.py). The values are rounded to multiples
+# of sim['ramp_tol'] (default 1E-3; 0 to use them as they are), so that
+# the gates only have to be built again when a value crosses to the next
+# multiple; the last few sets are kept (TEBD.Step_Operators), so memory
+# does not grow with the length of the ramp.
+# Returns model itself without ramps, else a copy without the 'ramp' entry.
+def Model_At(model, sim, t):
+	ramps = model.get('ramp')
+	if (not ramps):
+		return model
+	model = dict(model)
+	del model['ramp']
+	tol = sim.get('ramp_tol', 1E-3)
+	for name in ramps:
+		value = Ramp_Value(ramps[name], t)
+		if (tol):
+			value = round(value / tol) * tol
+		model[name] = value
+	return model
+
+# Value of a ramp (see Model_At) at time t
+def Ramp_Value(ramp, t):
+	if (callable(ramp)):
+		return float(ramp(t))
+	ts = [point[0] for point in ramp]
+	values = [point[1] for point in ramp]
+	return float(np.interp(t, ts, values))
+
+# Largest change of the Schmidt values of any bond between the
+# spectra old and new (lists of Lambda_l's, padded with zeros
+# where the bond dimension changed)
+def Spectrum_Change(old, new):
+	change = 0
+	for (a, b) in zip(old, new):
+		n = max(len(a), len(b))
+		a = np.pad(a.astype(np.float64), (0, n - len(a)), 'constant')
+		b = np.pad(b.astype(np.float64), (0, n - len(b)), 'constant')
+		change = max(change, np.linalg.norm(a - b))
+	return change
+
+# Pool of workers for Update_Layer, or None to update bonds one by one
+# sim['workers']: number of workers (default 1, no pool)
+# sim['pool']: 'thread' (default) or 'process'
+# sim['blas_threads']: BLAS threads per worker, so that the workers
+#	don't oversubscribe the node (default: leave BLAS alone); thread
+#	workers share the BLAS of this process, see Layer_BLAS
+def Layer_Pool(sim):
+	workers = sim.get('workers', 1)
+	if (workers <= 1):
+		return None
+	Check_BLAS(sim.get('blas_threads'))
+	if (sim.get('pool', 'thread') == 'process'):
+		return multiprocessing.Pool(workers, Limit_BLAS, (sim.get('blas_threads'),))
+	else:
+		return ThreadPool(workers)
+
+# BLAS limit for the thread workers of Layer_Pool, which share the BLAS
+# of this process, so it is limited only while the run lasts: returns
+# the limits to undo with Restore_BLAS (None if there are none)
+def Layer_BLAS(sim):
+	if (sim.get('workers', 1) <= 1 or sim.get('pool', 'thread') == 'process'):
+		return None
+	if (sim.get('blas_threads') is None or threadpool_limits is None):
+		return None
+	return threadpool_limits(limits=sim['blas_threads'])
+
+# Undo the limits of Layer_BLAS
+def Restore_BLAS(limits):
+	if (limits is not None):
+		limits.restore_original_limits()
+
+# Limit the number of threads used by BLAS in a worker (None: leave it).
+# BLAS is loaded with numpy, before any worker starts, so this needs
+# threadpoolctl; without it nothing changes (see BLAS_Capped).
+def Limit_BLAS(n):
+	if (n is None or threadpool_limits is None):
+		return
+	global _blas_limits
+	_blas_limits = threadpool_limits(limits=n)
+
+# Are the BLAS threads of this process (and of the workers it forks)
+# at most n? Always with threadpoolctl (Limit_BLAS); without it, only
+# if the environment set them before python started, e.g. by running
+# OMP_NUM_THREADS=1 python tebd.py, or through run.py
+def BLAS_Capped(n):
+	if (n is None or threadpool_limits is not None):
+		return True
+	for var in blas_variables:
+		value = _blas_environ[var]
+		if (value is not None and value.isdigit() and 0 < int(value) <= n):
+			return True
+	return False
+
+# Warn if BLAS cannot be limited to n threads (see BLAS_Capped)
+def Check_BLAS(n):
+	if (not BLAS_Capped(n)):
+		print "warning: cannot limit BLAS to {0} thread(s) per worker without threadpoolctl;".format(n)
+		print "	set OMP_NUM_THREADS={0} (or OPENBLAS_NUM_THREADS, MKL_NUM_THREADS) before starting python".format(n)
+
+# Number of Schmidt values to keep on a bond, given the (normalized)
+# singular values B sorted in decreasing order:
+# the fewest values whose discarded weight sum(B[chi:]**2) is at most sim['eps'],
+# but never more than the hard cap sim['chi'] and never fewer than one.
+def Bond_Dimension(B, sim):
+	return int(Bond_Dimensions(B, sim))
+
+# Bond_Dimension of every row of B (..., k), e.g. the bonds of the
+# members of a batch (batch.py); the weights are summed in double
+# precision, as the truncation error of Evolve_Bond is
+def Bond_Dimensions(B, sim):
+	eps = sim.get('eps', 1E-10)
+	# discarded[..., k] = weight thrown away by keeping only k values
+	weights = np.absolute(B).astype(np.float64)**2
+	discarded = np.cumsum(weights[..., ::-1], axis=-1)[..., ::-1]
+	chis = np.count_nonzero(discarded > eps, axis=-1)
+	return np.clip(chis, 1, sim['chi'])
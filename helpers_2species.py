@@ -1,5 +1,7 @@
 import numpy as np
 import math
+import gates
+import helpers
 
 # Cutoff for division by small numbers
 cutoff = 1E-2
@@ -22,7 +24,9 @@ class TEBD(object):
 		self.b_avg = np.zeros((sim['L'], sim['N']+1), dtype=np.complex64)
 		self.n_a_avg = np.zeros((sim['L'], sim['N']+1))
 		self.n_b_avg = np.zeros((sim['L'], sim['N']+1))
-		self.aa = np.zeros((sim['L'], sim['L']), dtype=np.complex64)
+		# aa[i, t, j] = <a^dag_i a_j> and nn[i, t, j] = <n_i n_j> (majority species)
+		self.aa = np.zeros((sim['L'], sim['N']+1 if logs['aa'] else 0, sim['L']), dtype=np.complex64)
+		self.nn = np.zeros((sim['L'], sim['N']+1 if logs['aa'] else 0, sim['L']))
 
 	# The simulation loop
 	def Run_Simulation(self):
@@ -32,8 +36,8 @@ class TEBD(object):
 		d = self.sim['d']
 		logs = self.logs
 
-		# Define operators
-		ops = Operators(self.model, self.sim)
+		# Define operators (built once per set of parameters)
+		ops = gates.Cached_Operators(Operators, self.model, self.sim)
 		V_odd = ops.V_odd
 		V_even = ops.V_even
 		V_last = ops.V_last
@@ -61,6 +65,8 @@ class TEBD(object):
 		if (logs['nb']):
 			for r in range(0, L):
 				self.n_b_avg[r,0] = np.real(np.trace(np.dot(self.Single_Site_Rho(r,'b'), n_b)))
+		if (logs['aa']):
+			self.aa[:,0,:], self.nn[:,0,:] = self.Correlations(ops)
 
 		# # Loop: do all the odds, then evens, then odds
 		for i in range(1, N+1):
@@ -108,15 +114,9 @@ class TEBD(object):
 					for r in range(0, L):
 						self.n_b_avg[r,i] = np.real(np.trace(np.dot(self.Single_Site_Rho(r,'b'), n_b)))
 				
-				# Only store SPDM at the very end
-				# Probably only want to do this for calculating GS
-				if (logs['aa'] and logs['skip'] == N - 1):
-					for l in range(0, L):
-						for k in range(l+1, L):
-							# Calculate <a^dag_k, a_l>
-							self.aa[l,k] = np.trace(np.dot(np.reshape(self.Two_Site_Rho(l, k), (d*d, d*d)), np.kron(a_op, a_dag)))
-						# Diagonal terms are number expectation values
-						self.aa[l,l] =np.trace(np.dot(self.Single_Site_Rho(l,'a'), n_op))
+				if (logs['aa']):
+					# Store <a^dag_i a_j> and <n_i n_j> for all pairs of sites
+					self.aa[:,i,:], self.nn[:,i,:] = self.Correlations(ops)
 
 			# Can delete this later:
 			if (i % 50 == 0):
@@ -306,64 +306,34 @@ class TEBD(object):
 				Rho = np.tensordot(np.identity(da), Rho, axes=([0,1], [0, 2]))
 		return Rho
 
-	# Calculate the reduced density matrix,
-	# tracing over all sites except site k and l
-	# See http://sourceforge.net/projects/opentebd/
-	# documentation
-	def Two_Site_Rho(self, l, k):
-		L = self.sim['L']; chi = self.sim['chi']; d = self.sim['d']
+	# <a^dag_i a_j> and <n_i n_j> of the majority species for all pairs of
+	# sites, one transfer sweep per row (see helpers.Correlation_Matrix)
+	def Correlations(self, ops):
+		L = self.sim['L']
+		A, W = self.A_Tensors()
+		a_full = np.kron(ops.a, np.identity(self.sim['db']))
+		n_a_full = np.kron(ops.n_a, np.identity(self.sim['db']))
+		aa, nn = helpers.Correlation_Matrix(A, W, [(np.transpose(a_full), a_full), (n_a_full, n_a_full)])
+		# On the diagonal: <n_i> and <n_i^2>
+		for r in range(0, L):
+			rho = self.Single_Site_Rho(r,'a')
+			aa[r,r] = np.trace(np.dot(rho, ops.n_a))
+			nn[r,r] = np.real(np.trace(np.dot(rho, np.dot(ops.n_a, ops.n_a))))
+		return aa, np.real(nn)
+
+	# The tensors A_l = Lambda_(l-1) Gamma_l of helpers.TEBD,
+	# all of shape (d, chi_(l-1), chi_l), and the squared Schmidt
+	# values on the bond to the right of each site
+	def A_Tensors(self):
+		L = self.sim['L']
 		Lambda = self.Lambda
 		Gamma = self.Gamma
-		swap = 0
-
-		# Assume l < k
-		if (k < l):
-			temp = k
-			k = l
-			l = temp
-			swap = 1
-
-		# Form tensor:	
-		if (k < L - 2):
-			tensor_l = np.tensordot(np.diag(Lambda[k]), Gamma[k], axes=(0,1))
-			tensor_l = np.tensordot(tensor_l, np.diag(Lambda[k+1]), axes=(-1, 0))
-			tensor_r = np.tensordot(np.diag(Lambda[k+1]), np.conjugate(Gamma[k]), axes=(0,-1))
-			tensor_r = np.tensordot(tensor_r, np.diag(Lambda[k]), axes=(-1,0))
-			tensor = np.tensordot(tensor_l, tensor_r, axes=(-1, 0))
-			# Arrange indices as (ik, ik', ak-1, ak-1')
-			tensor = np.transpose(tensor, (1,2,0,3))
-		elif (k == L - 2):
-			tensor_l = np.tensordot(np.diag(Lambda[k]), Gamma[k], axes=(0,1))
-			tensor_l = np.tensordot(tensor_l, np.identity(chi), axes=(-1, 0))
-			tensor_r = np.tensordot(np.identity(chi), np.conjugate(Gamma[k]), axes=(0,-1))
-			tensor_r = np.tensordot(tensor_r, np.diag(Lambda[k]), axes=(-1,0))
-			tensor = np.tensordot(tensor_l, tensor_r, axes=(-1, 0))
-			# Arrange indices as (ik, ik', ak-1, ak-1')
-			tensor = np.transpose(tensor, (1,2,0,3))
-		elif (k == L - 1):
-			tensor = np.outer(Gamma[k], np.conjugate(Gamma[k]))
-			tensor = np.reshape(tensor, (d, chi, d, chi))
-			tensor = np.transpose(tensor, (0,2,1,3))
-		for i in range(0, l-k-1):
-			tensor = np.tensordot(Gamma[k-1], tensor, axes=(-1,2))
-			tensor = np.tensordot(np.diag(Lambda[k-1]), tensor, axes=(-1, 1))
-			tensor = np.tensordot(tensor, np.conjugate(Gamma[k-1]), axes=([1,-1], [0, -1]))
-			tensor = np.tensordot(tensor, np.diag(Lambda[k-1]), axes=(-1, 0))
-			np.transpose(tensor, (1,2,0,3))
-
-		if (l != 0):
-			rho_ts = np.tensordot(tensor, np.conjugate(Gamma[l]), axes=(-1, -1))
-			rho_ts = np.tensordot(rho_ts, np.diag(Lambda[l]), axes=(-1, 0))
-			rho_ts = np.tensordot(Gamma[l], rho_ts, axes=(-1,2))
-			rho_ts = np.tensordot(np.diag(Lambda[l]), rho_ts, axes=([0, 1], [1,-1]))
-			# Transpose to (il, il', ik, ik')
-			rho_lk = np.transpose(rho_ts, (0,3,1,2))
-		else:
-			rho_ts = np.tensordot(tensor, np.conjugate(Gamma[l]), axes=(-1, -1))
-			rho_ts = np.tensordot(Gamma[l], rho_ts, axes=(-1,2))
-			# Transpose to (il, il', ik, ik')
-			rho_lk = np.transpose(rho_ts, (0,3,1,2))
-		return rho_lk
+		A = [Gamma[0][:, None, :]]
+		for l in range(1, L-1):
+			A.append(Lambda[l-1][None, :, None] * Gamma[l])
+		A.append((Lambda[L-2][None, :] * Gamma[L-1])[:, :, None])
+		W = [np.absolute(Lambda[l])**2 for l in range(0, L-1)] + [np.ones(1)]
+		return A, W
 
 
 # Operator definitions:
@@ -388,8 +358,9 @@ class Operators(object):
 		b_dag = np.transpose(b)
 		n_b = np.dot(b_dag, b)
 	
-		# Set up Hamiltonian
-		Ja = model['Ja']; Ua = model['Ua']; Jb = model['Jb']; Uab = model['Uab']; delta = sim['delta']
+		# Set up Hamiltonian (as floats: an integer Ua would be halved
+		# by integer division)
+		Ja = float(model['Ja']); Ua = float(model['Ua']); Jb = float(model['Jb']); Uab = float(model['Uab']); delta = sim['delta']
 
 		if (sim['it']):
 			mu = sim['mu'] * Ua
@@ -466,7 +437,7 @@ def Initialize_States(sim, init):
 		if (math.floor(n_onsite) >= 0):
 			# Check that you're under the number cutoff
 			if (math.floor(n_onsite) < n_max):
-				mat[:,math.floor(n_onsite)] = 1
+				mat[:,int(math.floor(n_onsite))] = 1
 			# If not, initialize to vacuum
 			else:
 				return mat
@@ -474,7 +445,7 @@ def Initialize_States(sim, init):
 			# Check for fractional occupation
 			if (n_onsite != math.floor(n_onsite)):
 				filling = n_onsite - math.floor(n_onsite)
-				rands = np.random.rand(L)
+				rands = helpers.Random_Numbers(init, L)
 				print rands
 				# Populate next highest state with probability = filling
 				for i in range(0, L):
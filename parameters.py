@@ -0,0 +1,132 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Default parameters of the simulations: the model, sim, init and logs
+# dicts of helpers.TEBD (tebd.py) and helpers_2species.TEBD
+# (two_species.py), and the logged arrays a sweep collects by default.
+# tebd.py, two_species.py and run.py all start from these.
+#
+# Nothing here imports numpy, so run.py can read the defaults before
+# the environment of the BLAS library is set (see run.Cap_BLAS).
+
+import copy
+
+# helpers.TEBD
+
+# Simulation and model parameters
+model = {'J': 1.0, 'U': 0.0}
+# J may also be a list of L-1 values (one per bond) and U a list of L values
+# (one per site), and model['mu_site'] adds a local chemical potential -mu_i n_i
+# (a number or L values), e.g. for a harmonic trap of strength V:
+#	model['mu_site'] = [-V * (i - (sim['L'] - 1) / 2.0)**2 for i in range(0, sim['L'])]
+# Quench ramps: model['ramp'] = {'U': [(0, 2.0), (5, 20.0)]} ramps U linearly
+# from 2 to 20 between t = 0 and t = 5 (a table of (t, value), or a function
+# of t); the gates follow in steps of sim['ramp_tol'] (see helpers.Model_At)
+# d = local Hilbert space dimension
+# chi = entanglement cutoff for TEBD (maximum bond dimension)
+# eps = largest discarded weight allowed when truncating a bond;
+#	bond dimensions grow and shrink with the Schmidt rank, up to chi
+# L = number of sites
+# delta = timestep
+# N = iterations
+# sym = True to conserve particle number and do the SVDs block by block
+#	(needs a Fock initial state, flag = 0 or 2)
+# schedule = Trotter splitting: 'trotter2' (second order), or 'forest-ruth',
+#	'suzuki4', 'omelyan4' (fourth order, fine with larger delta; see helpers.Schedules)
+# fuse = True to merge the odd half steps of consecutive
+#	iterations when nothing is logged in between
+# precision = 'single' (complex64 tensors, float32 Schmidt values)
+#	or 'double' (complex128, float64) for reference runs
+# gate_cache = directory to keep the gates in between runs (None: memory only)
+# ramp_tol = resolution of the ramped model parameters (0: exact)
+# ramp_cache = number of sets of ramp gates to keep (the most recent ones)
+# result_cache = directory to keep finished sweep points in (None: off);
+#	points found there are loaded instead of run again, and runs
+#	with a larger N continue from the cached one (see cache.py)
+# workers = number of threads/processes updating the bonds of a layer at once
+# pool = 'thread' or 'process'
+# blas_threads = BLAS threads per worker (None: leave BLAS alone, but one per
+#	process when the sweep itself runs in several, see sweep.Point_Pool;
+#	needs threadpoolctl or the environment, see helpers.BLAS_Capped)
+sim = {'d': 3, 'chi': 10, 'eps': 1E-10, 'L': 3, 'delta': 0.01, 'N': 100, 'sym': False, 'schedule': 'trotter2', 'fuse': True, 'precision': 'single',
+	'gate_cache': None, 'ramp_tol': 1E-3, 'ramp_cache': 4, 'result_cache': None, 'workers': 1, 'pool': 'thread', 'blas_threads': None}
+
+# Checkpoints for long runs: True to write one per sweep point
+# (<point name>.ckpt), and how often
+# (every so many iterations and/or seconds; always at the end).
+sim['checkpoint'] = None
+sim['checkpoint_every'] = None
+sim['checkpoint_time'] = 3600
+
+# Ground state search by imaginary time evolution instead of
+# time evolution (only the final state is logged):
+# mu = chemical potential in units of U (sets the filling unless sym = True)
+# The run stops once the energy and the Schmidt values change by less than
+# sim['tol'] per unit of imaginary time (default 1E-8, 1E-4 in single precision),
+# checked every 'check' iterations; delta is multiplied by 'anneal' each time
+# this happens, down to delta_min. N is the largest number of iterations.
+sim['it'] = False
+sim['mu'] = 0.5
+sim['check'] = 10
+sim['anneal'] = 0.1
+sim['delta_min'] = 1E-4
+
+# Profiling: True to time every phase of the run (bond updates phase by
+# phase, measurements, checkpoints) and report peak memory at the end,
+# 'memory' to count the arrays the bond updates and measurements make too
+sim['profile'] = False
+
+# Choose which expectation values to log:
+# n2 = <n^2>, for number fluctuations
+# E = energy of every bond (E_bond), to watch the energy drift
+# aa = all pairs <a^dag_i a_j> and <n_i n_j> (aa, nn), e.g. for the
+# momentum distribution (helpers.Momentum_Distribution)
+# S = entanglement entropy of every bond (S) and the weight discarded
+# on it since the previous logged step (discarded), to choose chi;
+# renyi = orders of Renyi entropies to log (S_renyi), e.g. [2];
+# schmidt = number of largest Schmidt values to log (schmidt)
+# Skip: how many iterations to skip between logging expectation values
+# e.g., skip = 9 to record every 10th data point
+# chunk: number of logged steps per file when streaming (logs['out'])
+logs = {'rho': False, 'a': True, 'n': True, 'n2': False, 'E': True, 'aa': False, 'S': False, 'renyi': [], 'schmidt': 0, 'skip': 0,
+	'chunk': 1000}
+
+# Choose your initial state:
+# state_flag = 0 for Fock states, = 1 for coherent states
+# flag = 2 to initialize on site k
+# (with flag = 0 and a fractional nbar the extra particles go on random
+# sites; init['seed'] fixes which)
+init = {'nbar': 1, 'flag': 2, 'site': 1}
+
+# helpers_2species.TEBD
+
+model_2species = {'Ja': 1.0, 'Ua': 0.0, 'Jb': 0.0, 'Uab': 0.0}
+# Note: set 'it' == True to find ground state, False to calculate real time evolution
+# If doing imaginary time evolution, we need to add in a chemical potential term to conserve number
+# mu is in units of U
+sim_2species = {'da': 4, 'db': 1, 'chi': 50, 'L': 4, 'delta': 0.001, 'N': 200, 'it': False, 'mu': 0.5}
+# Local Hilbert space dimension: 'da' dimensions for majority, 2 dimensional for minority
+sim_2species['d'] = sim_2species['da'] * sim_2species['db']
+
+# Choose which expectation values to log:
+# aa: <a^dag_i a_j> and <n_i n_j> of the majority species (aa, nn)
+# Skip: how many iterations to skip between logging expectation values
+logs_2species = {'rho': False, 'a': True, 'b': False, 'na': True, 'nb': True, 'aa': False, 'skip': 0}
+
+# Choose your initial state:
+# For majority: flag = 0 for Fock states, = 1 for coherent states
+# site = site to initialize impurity on
+init_2species = {'nbar': 0.5, 'flag': 0, 'site': 1}
+
+# The defaults by module, with the logged arrays a sweep collects
+defaults = {
+	'helpers': {'model': model, 'sim': sim, 'init': init, 'logs': logs,
+		'fields': ['a_avg', 'n_avg']},
+	'helpers_2species': {'model': model_2species, 'sim': sim_2species, 'init': init_2species, 'logs': logs_2species,
+		'fields': ['a_avg', 'n_a_avg', 'n_b_avg']},
+}
+
+# Copies of the default model, sim, init and logs dicts of module
+# ('helpers' or 'helpers_2species'), to change as a run needs
+def Defaults(module):
+	params = copy.deepcopy(defaults[module])
+	return params['model'], params['sim'], params['init'], params['logs']
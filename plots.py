@@ -0,0 +1,158 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Plots of the logged data of one sweep point,
+# for tebd.py, two_species.py and run.py.
+#
+# matplotlib is only imported when a plot is made, so runs that do not
+# plot (e.g. run.py on batch nodes) never load it. Every figure is
+# saved as <filename>_<quantity>.pdf; show = True also opens them
+# (headless = True selects the non-interactive Agg backend instead,
+# for machines without a display).
+
+import numpy as np
+import math
+
+# matplotlib.pyplot, imported on first use
+def Pyplot(headless=False):
+	import matplotlib
+	if (headless):
+		matplotlib.use('Agg')
+	from matplotlib import pyplot as plt
+	return plt
+
+# |<a_i(t)>| and <n_i(t)> of a helpers.TEBD run (a_avg, n_avg of one point),
+# with the coherent state collapse and revival curve for comparison
+# (for a uniform U), and the exact evolution (an exact.Exact run)
+# if reference is given
+def Plot_TEBD(a_avg, n_avg, model, sim, init, logs, filename, reference=None, show=True, headless=False):
+	plt = Pyplot(headless)
+	# Plots for <a>
+	# Plot stuff
+	L = sim['L']; chi = sim['chi']; d = sim['d']; delta = sim['delta']; N = sim['N']
+	f, ax = plt.subplots(L, sharex=True, sharey=True)
+	ts = np.linspace(0, (N+1)*delta, num=1+N/(logs['skip'] + 1))
+	indmax = int(1 + N/(logs['skip'] + 1))
+	for i in range(0, L):
+		ax[i].plot(ts, np.absolute(a_avg[i,0:indmax]), 'bo', label="TEBD site {0}".format(i))
+		if (np.isscalar(model['U'])):
+			ax[i].plot(ts, np.absolute(np.sqrt(init['nbar']) * np.exp(init['nbar'] * np.expm1(-1j * ts * model['U']))), 'r-', linewidth=2)
+		if (reference is not None):
+			ax[i].plot(ts, np.absolute(reference.a_avg[i,0:indmax]), 'g-', label="exact")
+		ax[i].legend()
+		ax[i].set_yticks(np.linspace(0,1.5,num=4))
+		ax[i].set_yticklabels(np.linspace(0,1.5,num=4))
+		ax[i].set_ylim([-0.4, 1.9])
+	ax[0].set_title(r"TEBD simulation: $L = {0}$, $d = {1}$, $\chi = {2}$".format(L,d,chi), fontsize=18)
+	f.subplots_adjust(hspace=0)
+	plt.setp([a.get_xticklabels() for a in f.axes[:-1]], visible=False)
+
+	f.add_subplot(111, frameon=False)
+	# hide tick and tick label of the big axes
+	plt.tick_params(labelcolor='none', top='off', bottom='off', left='off', right='off')
+
+	plt.xlabel(r"t ($\hbar/U$)", fontsize=16)
+	plt.ylabel(r"$|\langle a(t) \rangle|$", fontsize=16)
+	plt.savefig(filename + "_a.pdf", format="pdf")
+
+
+	# Plots for <n>
+	# Plot stuff
+	L = sim['L']; chi = sim['chi']; d = sim['d']; delta = sim['delta']; N = sim['N']
+	f, ax = plt.subplots(L+1, sharex=True, sharey=False)
+	for i in range(0, L):
+		ax[i].plot(ts, np.absolute(n_avg[i,0:indmax]), 'bo', label="TEBD site {0}".format(i))
+		if (reference is not None):
+			ax[i].plot(ts, reference.n_avg[i,0:indmax], 'g-', label="exact")
+		ax[i].legend()
+		ax[i].set_yticks(np.linspace(0,2,num=3))
+		ax[i].set_yticklabels(np.linspace(0,2,num=3))
+		ax[i].set_ylim([-0.4, 2.4])
+	ax[L].plot(ts, np.sum(np.absolute(n_avg[:,0:indmax]), 0), 'ro', label="total n")
+	ax[L].legend()
+	ax[L].set_yticks(np.linspace(init['nbar']-0.25,init['nbar']+0.25,num=3))
+	ax[L].set_yticklabels(np.linspace(init['nbar']-0.25,init['nbar']+0.25,num=3))
+	ax[L].set_ylim([init['nbar']-0.5, init['nbar']+0.5])
+	ax[0].set_title(r"TEBD simulation: $L = {0}$, $d = {1}$, $\chi = {2}$".format(L,d,chi), fontsize=18)
+	f.subplots_adjust(hspace=0)
+	plt.setp([a.get_xticklabels() for a in f.axes[:-1]], visible=False)
+
+	f.add_subplot(111, frameon=False)
+	# hide tick and tick label of the big axes
+	plt.tick_params(labelcolor='none', top='off', bottom='off', left='off', right='off')
+
+	plt.xlabel(r"t ($\hbar/J$)", fontsize=16)
+	plt.ylabel(r"$\langle n(t) \rangle$", fontsize=16)
+	plt.savefig(filename + "_n.pdf", format="pdf")
+	if (show):
+		plt.show()
+
+# |<a_i(t)>|, <n_b,i(t)> and <n_a,i(t)> of a helpers_2species.TEBD run
+def Plot_Two_Species(a_avg, n_a_avg, n_b_avg, model, sim, init, logs, filename, show=True, headless=False):
+	plt = Pyplot(headless)
+	# Plot stuff
+	L = sim['L']; chi = sim['chi']; d = sim['d']; delta = sim['delta']; N = sim['N']
+	f, ax = plt.subplots(L, sharex=True, sharey=True)
+	for i in range(0, L):
+		ts = np.linspace(0, (N+1)*delta, num=N+1)
+		ax[i].plot(ts, np.absolute(a_avg[i,:]), 'bo', label="TEBD site {0}".format(i))
+		ax[i].plot(ts, np.absolute(math.sqrt(init['nbar']) * np.exp(init['nbar'] * np.expm1(-1j * ts * model['Ua']))), 'r-', linewidth=2)
+		ax[i].legend()
+		ax[i].set_yticks(np.arange(0,1.5,0.5))
+		ax[i].set_yticklabels(np.arange(0,1.5,0.5))
+		ax[i].set_ylim([-0.1, 1.1])
+	ax[0].set_title(r"TEBD simulation: $L = {0}$, $d = {1}$, $\chi = {2}$".format(L,d,chi), fontsize=18)
+	f.subplots_adjust(hspace=0)
+	plt.setp([a.get_xticklabels() for a in f.axes[:-1]], visible=False)
+
+	f.add_subplot(111, frameon=False)
+	# hide tick and tick label of the big axes
+	plt.tick_params(labelcolor='none', top='off', bottom='off', left='off', right='off')
+
+	plt.xlabel(r"t ($\hbar/U_a$)", fontsize=16)
+	plt.ylabel(r"$|\langle a(t) \rangle|$", fontsize=16)
+	plt.savefig(filename + "_a.pdf", format="pdf")
+
+	# Plot stuff
+	L = sim['L']; chi = sim['chi']; d = sim['d']; delta = sim['delta']; N = sim['N']
+	f, ax = plt.subplots(L, sharex=True, sharey=True)
+	for i in range(0, L):
+		ts = np.linspace(0, (N+1)*delta, num=(N+1))
+		ax[i].plot(ts, np.absolute(n_b_avg[i,:]), 'bo', label="TEBD site {0}".format(i))
+		ax[i].set_yticks(np.arange(0,1.5,0.5))
+		ax[i].set_yticklabels(np.arange(0,1.5,0.5))
+		ax[i].set_ylim([-0.1, 1.1])
+	ax[0].set_title(r"TEBD simulation: $L = {0}$, $d = {1}$, $\chi = {2}$".format(L,d,chi), fontsize=18)
+	f.subplots_adjust(hspace=0)
+	plt.setp([a.get_xticklabels() for a in f.axes[:-1]], visible=False)
+
+	f.add_subplot(111, frameon=False)
+	# hide tick and tick label of the big axes
+	plt.tick_params(labelcolor='none', top='off', bottom='off', left='off', right='off')
+
+	plt.xlabel(r"t ($\hbar/J_b$)", fontsize=16)
+	plt.ylabel(r"$\langle n_b(t) \rangle$", fontsize=16)
+	plt.savefig(filename + "_b.pdf", format="pdf")
+
+
+	# Plot stuff
+	L = sim['L']; chi = sim['chi']; d = sim['d']; delta = sim['delta']; N = sim['N']
+	f, ax = plt.subplots(L, sharex=True, sharey=True)
+	for i in range(0, L):
+		ts = np.linspace(0, (N+1)*delta, num=(N+1))
+		ax[i].plot(ts, np.absolute(n_a_avg[i,:]), 'bo', label="TEBD site {0}".format(i))
+		ax[i].set_yticks(np.arange(0,4.5,0.5))
+		ax[i].set_yticklabels(np.arange(0,4.5,0.5))
+		ax[i].set_ylim([-0.1, 4.1])
+	ax[0].set_title(r"TEBD simulation: $L = {0}$, $d = {1}$, $\chi = {2}$".format(L,d,chi), fontsize=18)
+	f.subplots_adjust(hspace=0)
+	plt.setp([a.get_xticklabels() for a in f.axes[:-1]], visible=False)
+
+	f.add_subplot(111, frameon=False)
+	# hide tick and tick label of the big axes
+	plt.tick_params(labelcolor='none', top='off', bottom='off', left='off', right='off')
+
+	plt.xlabel(r"t ($\hbar/J_b$)", fontsize=16)
+	plt.ylabel(r"$\langle n_a(t) \rangle$", fontsize=16)
+	plt.savefig(filename + "_na.pdf", format="pdf")
+	if (show):
+		plt.show()
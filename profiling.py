@@ -0,0 +1,166 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Opt-in profiling of the TEBD simulations (helpers.py).
+#
+# With sim['profile'] set, helpers.TEBD keeps a Profile of the run:
+# wall-clock time and number of calls of every phase of the bond
+# updates (see helpers.Evolve_Bond: building Theta, applying the gate,
+# reshaping, the energy, the SVD, truncating and splitting), of the
+# layers as a whole, of Measure and of the checkpoints, a few counters
+# (bond updates, size of the SVDs) and the peak resident memory.
+# That peak is the high-water mark of the whole process, so with several
+# runs in one process (e.g. the points of a sweep in a pool worker) it
+# can be an earlier run's; the report gives its value at the start of the
+# run too, and says whether this run raised it.
+# With sim['profile'] == 'memory', the main arrays the bond updates and
+# Measure make are counted too, with their total size in bytes. They are
+# counted by hand where they are made (Allocated), so temporaries inside
+# numpy calls are not, and views of arrays already counted are left out.
+#
+# The bond phases are timed where the bonds are evolved, so with a
+# worker pool (sim['workers']) they add up the time of all the workers
+# and can exceed the wall-clock time of the layers.
+#
+# The report is printed at the end of Run_Simulation, kept in
+# simulation.profile, and written to the sweep output by sweep.Run_Point.
+
+import timeit
+import sys
+try:
+	import resource
+except ImportError:
+	resource = None
+
+# Laps of one bond update (helpers.Evolve_Bond); plain dicts,
+# so that it can be returned from a worker process
+class Clock(object):
+	def __init__(self, memory=False):
+		self.times = {}
+		self.counts = {}
+		self.memory = memory
+		self.last = timeit.default_timer()
+
+	# Charge the time since the last lap to phase
+	def Lap(self, phase):
+		now = timeit.default_timer()
+		self.times[phase] = self.times.get(phase, 0) + now - self.last
+		self.last = now
+
+	def Count(self, name, n=1):
+		self.counts[name] = self.counts.get(name, 0) + n
+
+	# Count newly made arrays (with memory set)
+	def Allocated(self, *arrays):
+		if (self.memory):
+			Count_Arrays(self, arrays)
+
+# Time spent in each phase of a run, counters and peak memory
+class Profile(object):
+	def __init__(self, memory=False):
+		self.totals = {}
+		self.calls = {}
+		self.counts = {}
+		self.memory = memory
+		self.start = timeit.default_timer()
+		self.wall = None
+		# High-water mark of the process before this run
+		self.start_rss = Peak_RSS()
+
+	def Add(self, phase, seconds, calls=1):
+		self.totals[phase] = self.totals.get(phase, 0) + seconds
+		self.calls[phase] = self.calls.get(phase, 0) + calls
+
+	def Count(self, name, n=1):
+		self.counts[name] = self.counts.get(name, 0) + n
+
+	# Count newly made arrays (with memory set)
+	def Allocated(self, *arrays):
+		if (self.memory):
+			Count_Arrays(self, arrays)
+
+	# Add the laps of a bond update (a Clock)
+	def Merge(self, clock):
+		for phase in clock.times:
+			self.Add("bond: " + phase, clock.times[phase])
+		for name in clock.counts:
+			self.Count(name, clock.counts[name])
+
+	# Time the body of a with statement as phase
+	def Phase(self, phase):
+		return Timer(self, phase)
+
+	# Stop the clock and read off the memory; called at the end of the run
+	def Finish(self):
+		self.wall = timeit.default_timer() - self.start
+		self.peak_rss = Peak_RSS()
+
+	# The breakdown as a table, longest phases first
+	def Report(self):
+		wall = self.wall
+		if (wall is None):
+			wall = timeit.default_timer() - self.start
+		lines = ["{0:24s} {1:>10s} {2:>12s} {3:>12s} {4:>7s}".format("phase", "calls", "total (s)", "per call (s)", "% wall")]
+		for phase in sorted(self.totals, key=lambda p: -self.totals[p]):
+			total = self.totals[phase]; calls = self.calls[phase]
+			lines.append("{0:24s} {1:10d} {2:12.4f} {3:12.3e} {4:7.1f}".format(
+				phase, calls, total, total / calls, 100 * total / wall))
+		lines.append("wall-clock time: {0:.4f} s".format(wall))
+		for name in sorted(self.counts):
+			if (name in ['arrays allocated', 'bytes allocated']):
+				continue
+			lines.append("{0}: {1}".format(name, self.counts[name]))
+		if (getattr(self, 'peak_rss', None) is not None):
+			if (self.peak_rss > self.start_rss):
+				change = "raised by this run from {0:.1f} MB".format(self.start_rss / 2.0**20)
+			else:
+				change = "reached before this run"
+			lines.append("peak memory of the process (RSS high-water mark): {0:.1f} MB, {1}".format(
+				self.peak_rss / 2.0**20, change))
+		if ('bytes allocated' in self.counts):
+			lines.append("arrays made by the bond updates and Measure (counted by hand): {0:.1f} MB in {1} arrays".format(
+				self.counts['bytes allocated'] / 2.0**20, self.counts['arrays allocated']))
+		return "\n".join(lines)
+
+# Add the number and total size of arrays to the counters of a Clock or Profile
+def Count_Arrays(counter, arrays):
+	counter.Count('arrays allocated', len(arrays))
+	counter.Count('bytes allocated', sum([array.nbytes for array in arrays]))
+
+# Context manager for Profile.Phase
+class Timer(object):
+	def __init__(self, profile, phase):
+		self.profile = profile
+		self.phase = phase
+
+	def __enter__(self):
+		self.start = timeit.default_timer()
+
+	def __exit__(self, *exc):
+		self.profile.Add(self.phase, timeit.default_timer() - self.start)
+		return False
+
+# Does nothing, for phases of runs that are not profiled
+class No_Timer(object):
+	def __enter__(self):
+		pass
+
+	def __exit__(self, *exc):
+		return False
+
+no_timer = No_Timer()
+
+# Phase of profile, or no_timer if profile is None
+def Phase(profile, phase):
+	if (profile is None):
+		return no_timer
+	return profile.Phase(phase)
+
+# Peak resident memory of this process in bytes (None where unavailable)
+def Peak_RSS():
+	if (resource is None):
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	if (sys.platform == 'darwin'):
+		return peak
+	return peak * 1024
@@ -0,0 +1,84 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Regression check of helpers.TEBD against the exact evolution (exact.py).
+#
+# Runs a few short chains (L <= 5) in double precision with eps = 1E-20,
+# so that nothing is truncated and the only error left is the Trotter
+# error of the schedule (with eps = 1E-14 the discarded weight alone
+# puts the states off by ~1E-7, more than a fourth order schedule), and
+# compares a_avg, n_avg and n2_avg with exact.Exact on every logged
+# step. The cases cover the plain second order evolution, the
+# particle-number conserving mode (sim['sym']), fused half steps
+# (sim['fuse']), the fourth order schedules, integer model parameters and
+# a site-dependent model.
+# Each case has its own tolerance, set well above the Trotter error it
+# should have after a unit of time at delta = 0.01: ~2E-4 for the second
+# order schedule, ~5E-8 for forest-ruth and ~2E-9 for suzuki4 and omelyan4.
+#	python regression.py			all cases
+#	python regression.py --case sym		one case (repeatable)
+# Exits with status 1 if any case is off by more than its tolerance.
+
+import numpy as np
+import sys
+import argparse
+import helpers
+import exact
+
+model = {'J': 1.0, 'U': 2.0}
+sim = {'d': 3, 'chi': 50, 'eps': 1E-20, 'L': 5, 'delta': 0.01, 'N': 100, 'sym': False,
+	'schedule': 'trotter2', 'fuse': False, 'precision': 'double', 'it': False}
+# A Fock state with one or two particles on each site
+init = {'nbar': 1.5, 'flag': 0, 'site': 0, 'seed': 1}
+logs = {'rho': False, 'a': True, 'n': True, 'n2': True, 'E': False, 'aa': False, 'S': False, 'skip': 4}
+
+# name: (changes to model, sim, init; tolerance)
+cases = [
+	('plain', {}, {}, {}, 1E-3),
+	# (integer parameters, as a JSON spec gives them)
+	('integer', {'J': 1, 'U': 3}, {}, {'nbar': 2, 'flag': 2, 'site': 2}, 1E-3),
+	('coherent', {}, {}, {'nbar': 0.8, 'flag': 1}, 1E-4),
+	('sym', {}, {'sym': True}, {}, 1E-3),
+	('fuse', {}, {'fuse': True}, {}, 1E-3),
+	('sym-fuse', {}, {'sym': True, 'fuse': True}, {}, 1E-3),
+	('forest-ruth', {}, {'schedule': 'forest-ruth'}, {}, 1E-6),
+	('suzuki4', {}, {'schedule': 'suzuki4', 'fuse': True}, {}, 2E-8),
+	('omelyan4', {}, {'schedule': 'omelyan4', 'sym': True}, {}, 2E-8),
+	('site-dependent', {'J': [1.0, 0.8, 1.2, 0.9], 'U': [2.0, 1.5, 2.5, 2.0, 1.0],
+		'mu_site': [0.3, -0.2, 0.0, 0.1, -0.4]}, {}, {'nbar': 1, 'flag': 2, 'site': 2}, 1E-4),
+	('site-dependent-sym', {'J': [1.0, 0.8, 1.2, 0.9], 'mu_site': [0.3, -0.2, 0.0, 0.1, -0.4]},
+		{'sym': True, 'fuse': True, 'schedule': 'omelyan4'}, {}, 2E-8),
+]
+
+# Largest difference between TEBD and the exact evolution of a case
+def Run_Case(model_changes, sim_changes, init_changes):
+	case_model = dict(model, **model_changes)
+	case_sim = dict(sim, **sim_changes)
+	case_init = dict(init, **init_changes)
+	simulation = helpers.TEBD(case_model, case_sim, case_init, dict(logs))
+	simulation.Run_Simulation()
+	reference = exact.Exact(case_model, case_sim, case_init, dict(logs))
+	reference.Run_Simulation()
+	return max([np.max(np.abs(getattr(simulation, field) - getattr(reference, field)))
+		for field in ['a_avg', 'n_avg', 'n2_avg']])
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Compare helpers.TEBD with exact.Exact on small chains")
+	parser.add_argument('--case', action='append', choices=[case[0] for case in cases],
+		help="run only this case (repeatable)")
+	args = parser.parse_args()
+
+	failed = []
+	results = []
+	for (name, model_changes, sim_changes, init_changes, tol) in cases:
+		if (args.case and name not in args.case):
+			continue
+		error = Run_Case(model_changes, sim_changes, init_changes)
+		results.append((name, error, tol))
+		if (not error <= tol):
+			failed.append(name)
+	for (name, error, tol) in results:
+		print "{0:20s} error {1:.2e} (tolerance {2:.0e}){3}".format(name, error, tol, "  FAILED" if name in failed else "")
+	if (len(failed) != 0):
+		print "{0} of {1} cases failed".format(len(failed), len(results))
+		sys.exit(1)
+	print "all {0} cases passed".format(len(results))
@@ -0,0 +1,188 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Command line entry point for running sweeps from a job spec,
+# without editing tebd.py or two_species.py, e.g. on a cluster:
+#	python -m run job.json
+#	python -m run job.toml --set sim.chi=20 --set model.U=2.0 --workers 4
+#
+# A job spec is a JSON (or, with the toml package, TOML) file with the
+# model, sim, init and logs dicts of the run; whatever it leaves out is
+# taken from the defaults of tebd.py and two_species.py (parameters.py).
+# Other keys:
+#	module = 'helpers' (default) or 'helpers_2species'
+#	sweep = {par: [values], ...}, every combination of the values is a
+#		sweep point (the last parameter varies fastest); or, as in
+#		tebd.py, sweep_par = [par, ...] and sweep_range = [[value, ...], ...]
+#	fields = logged arrays to collect into <prefix>_sweep.npz
+#	prefix = output name (default: the spec name and the time)
+#	workers, batch, resume, stream, samples, seed = as in tebd.py
+# The time-evolution figures of the last point (plots.py) are only made
+# with --plot (saved, headless) or --show (opened too), so matplotlib is
+# not loaded otherwise; nor are the simulation modules (and numpy) before
+# the sweep runs, so that the BLAS thread cap of the workers (Cap_BLAS)
+# is in the environment when numpy loads BLAS.
+
+import json
+import os
+import sys
+import copy
+import datetime
+import argparse
+import collections
+import parameters
+try:
+	import toml
+except ImportError:
+	toml = None
+
+# Environment variables that set the number of BLAS threads
+# (as helpers.blas_variables)
+blas_variables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+# With several workers, cap BLAS in every process at sim['blas_threads']
+# threads (default one) through the environment. BLAS reads it only when
+# numpy loads it, so this runs before anything imports numpy; variables
+# that are already set are left alone.
+def Cap_BLAS(spec):
+	if (spec.get('workers', 1) <= 1):
+		return
+	threads = spec.get('sim', {}).get('blas_threads')
+	if (threads is None):
+		threads = 1
+	for var in blas_variables:
+		os.environ.setdefault(var, str(threads))
+
+# The job spec in filename (.json, or .toml with the toml package)
+def Load_Spec(filename):
+	if (filename.endswith(".toml")):
+		if (toml is None):
+			raise ValueError("reading {0} needs the toml package".format(filename))
+		with open(filename) as f:
+			return toml.load(f)
+	with open(filename) as f:
+		return json.load(f, object_pairs_hook=collections.OrderedDict)
+
+# Apply an override "section.key=value" to spec; value is read as
+# JSON if it can be (numbers, true/false, null, lists), else as a string
+def Set(spec, override):
+	if ('=' not in override):
+		raise ValueError("--set needs section.key=value, not {0}".format(override))
+	path, value = override.split('=', 1)
+	try:
+		value = json.loads(value)
+	except ValueError:
+		pass
+	keys = path.split('.')
+	target = spec
+	for key in keys[:-1]:
+		target = target.setdefault(key, collections.OrderedDict())
+	target[keys[-1]] = value
+
+# The model, sim, init and logs dicts of a spec, completed with the defaults
+def Parameters(spec):
+	module = spec.get('module', 'helpers')
+	if (module not in parameters.defaults):
+		raise ValueError("unknown module {0} (helpers or helpers_2species)".format(module))
+	dicts = []
+	for section in ['model', 'sim', 'init', 'logs']:
+		params = copy.deepcopy(parameters.defaults[module][section])
+		params.update(spec.get(section, {}))
+		dicts.append(params)
+	model, sim, init, logs = dicts
+	if (module == 'helpers_2species' and 'd' not in spec.get('sim', {})):
+		sim['d'] = sim['da'] * sim['db']
+	return module, model, sim, init, logs
+
+# sweep_par and sweep_range of a spec (a single point if it sweeps nothing)
+def Sweep_Points(spec, model):
+	if ('sweep' in spec):
+		sweep_par = list(spec['sweep'].keys())
+		sweep_range = [()]
+		for par in sweep_par:
+			values = spec['sweep'][par]
+			if (not isinstance(values, list)):
+				values = [values]
+			sweep_range = [point + (value,) for point in sweep_range for value in values]
+		return sweep_par, sweep_range
+	if ('sweep_par' in spec):
+		return list(spec['sweep_par']), [tuple(values) for values in spec['sweep_range']]
+	# One point, named after the first model parameter
+	par = list(model.keys())[0]
+	return [par], [(model[par],)]
+
+# Run the job of spec; returns the result table of sweep.Run_Sweep
+def Run_Job(spec, plot=False, show=False):
+	import sweep
+	module, model, sim, init, logs = Parameters(spec)
+	sweep_par, sweep_range = Sweep_Points(spec, model)
+	fields = list(spec.get('fields', parameters.defaults[module]['fields']))
+	if (sim.get('it', False)):
+		fields += [field for field in ['energy', 'iterations'] if field not in fields]
+	prefix = spec['prefix']
+	if (spec.get('stream', False)):
+		logs['out'] = prefix + "_data"
+
+	if (spec.get('samples', 1) > 1):
+		import ensemble
+		table = ensemble.Run_Sweep(module, model, sim, init, logs, sweep_par, sweep_range, prefix,
+			spec['samples'], seed=spec.get('seed', 0), workers=spec.get('workers', 1), fields=fields)
+	else:
+		table = sweep.Run_Sweep(module, model, sim, init, logs, sweep_par, sweep_range, prefix,
+			workers=spec.get('workers', 1), fields=fields, resume=spec.get('resume', False), batch=spec.get('batch', False))
+	print "{0} points, results in {1}_sweep.npz".format(len(sweep_range), prefix)
+	for i in range(0, len(sweep_range)):
+		line = " ".join(["{0} = {1}".format(sweep_par[j], sweep_range[i][j]) for j in range(0, len(sweep_par))])
+		line += ": tau = {0}".format(table['tau'][i])
+		if ('energy' in table):
+			line += " E = {0} iterations = {1}".format(table['energy'][i], table['iterations'][i])
+		print line
+
+	if ((plot or show) and not sim.get('it', False)):
+		Plot_Last_Point(table, module, model, sim, init, logs, sweep_par, sweep_range, prefix, show)
+	return table
+
+# Figures of the last sweep point (plots.py)
+def Plot_Last_Point(table, module, model, sim, init, logs, sweep_par, sweep_range, prefix, show):
+	import sweep
+	import plots
+	model, sim, init, logs = sweep.Point(model, sim, init, logs, sweep_par, sweep_range[-1])
+	name = sweep.Point_Name(prefix, len(sweep_range) - 1, sweep_par, sweep_range[-1])
+	if (logs.get('out')):
+		import storage
+		data = storage.Load_Results(name + "_data")
+	else:
+		data = dict([(field, table[field][-1]) for field in table if field not in ['params', 'tau']])
+	if (module == 'helpers'):
+		plots.Plot_TEBD(data['a_avg'], data['n_avg'], model, sim, init, logs, name, show=show, headless=not show)
+	else:
+		plots.Plot_Two_Species(data['a_avg'], data['n_a_avg'], data['n_b_avg'], model, sim, init, logs, name, show=show, headless=not show)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Run a TEBD sweep from a job spec")
+	parser.add_argument('spec', help="job spec (.json or .toml)")
+	parser.add_argument('--set', action='append', default=[], metavar='SECTION.KEY=VALUE',
+		help="override a parameter of the spec, e.g. sim.chi=20 (repeatable)")
+	parser.add_argument('--workers', type=int, help="sweep points to run at the same time")
+	parser.add_argument('--prefix', help="output name")
+	parser.add_argument('--plot', action='store_true', help="save the figures of the last point")
+	parser.add_argument('--show', action='store_true', help="save and show the figures of the last point")
+	args = parser.parse_args()
+
+	try:
+		spec = Load_Spec(args.spec)
+		for override in args.set:
+			Set(spec, override)
+	except ValueError as e:
+		sys.exit("{0}: {1}".format(args.spec, e))
+	if (args.workers is not None):
+		spec['workers'] = args.workers
+	if (args.prefix is not None):
+		spec['prefix'] = args.prefix
+	if ('prefix' not in spec):
+		base = os.path.splitext(os.path.basename(args.spec))[0]
+		spec['prefix'] = base + "_" + datetime.datetime.now().strftime("%m_%d_%H_%M_%S")
+	Cap_BLAS(spec)
+	try:
+		Run_Job(spec, plot=args.plot, show=args.show)
+	except ValueError as e:
+		sys.exit("{0}: {1}".format(args.spec, e))
@@ -0,0 +1,118 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Streaming storage for the data logged by helpers.TEBD.
+#
+# Instead of holding every logged time step in memory, the
+# simulation appends each sample to a Sink, which writes them out
+# in chunks as compressed .npz shards in a directory:
+#	path/shard_000000000.npz, path/shard_000001000.npz, ...
+# Each shard holds one array per field, with time as the first axis.
+#
+# Load_Results reads a finished (or partial) run back with the
+# same (L, time, ...) layout as the TEBD arrays, memory-mapped so that
+# plotting long runs doesn't load the whole trajectory.
+
+import numpy as np
+import os
+import glob
+
+# Append-only writer for logged samples
+class Sink(object):
+	def __init__(self, path, chunk=1000):
+		self.path = path
+		self.chunk = chunk
+		# Samples not yet written, per field
+		self.buffers = {}
+		# Number of samples in the buffers
+		self.pending = 0
+		# Number of samples already on disk
+		self.count = 0
+		if (not os.path.isdir(path)):
+			os.makedirs(path)
+
+	# Add one time sample; fields maps field names to arrays
+	# (e.g. {'n_avg': n_avg[:,ind]}), the same fields every time
+	def Append(self, fields):
+		for name in fields:
+			self.buffers.setdefault(name, []).append(np.array(fields[name]))
+		self.pending += 1
+		if (self.pending >= self.chunk):
+			self.Flush()
+
+	# Write the buffered samples as one shard
+	def Flush(self):
+		if (self.pending == 0):
+			return
+		data = {}
+		for name in self.buffers:
+			data[name] = np.array(self.buffers[name])
+		filename = os.path.join(self.path, "shard_{0:09d}.npz".format(self.count))
+		# Write to a temporary file first so that a shard on disk is always complete
+		tmp = filename + ".tmp.npz"
+		np.savez_compressed(tmp, **data)
+		os.rename(tmp, filename)
+		self.count += self.pending
+		self.buffers = {}
+		self.pending = 0
+
+	def Close(self):
+		self.Flush()
+
+	# Forget everything after the first count samples
+	# (used when resuming from a checkpoint, which flushes the sink,
+	# so count always falls on a shard boundary)
+	def Truncate(self, count):
+		self.buffers = {}
+		self.pending = 0
+		for shard in Shards(self.path):
+			start = int(os.path.basename(shard)[6:15])
+			if (start >= count):
+				os.remove(shard)
+		# The consolidated files may hold the dropped samples
+		for filename in glob.glob(os.path.join(self.path, "*.npy")):
+			os.remove(filename)
+		self.count = count
+
+# Shards in the directory path, in time order
+def Shards(path):
+	return sorted(glob.glob(os.path.join(path, "shard_*[0-9].npz")))
+
+# Read back the data written by a Sink.
+# Returns a dict of read-only arrays with time as the second axis,
+# e.g. results['n_avg'][site, t], like the arrays of helpers.TEBD.
+# On first use (or after new shards appear) the shards of each field are
+# concatenated into path/<field>.npy, which is then memory-mapped.
+def Load_Results(path):
+	shards = Shards(path)
+	results = {}
+	if (len(shards) == 0):
+		return results
+	newest = max([os.path.getmtime(shard) for shard in shards])
+	with np.load(shards[0]) as first:
+		names = list(first.keys())
+	for name in names:
+		filename = os.path.join(path, name + ".npy")
+		if (not os.path.exists(filename) or os.path.getmtime(filename) < newest):
+			Consolidate(shards, name, filename)
+		data = np.load(filename, mmap_mode='r')
+		results[name] = np.moveaxis(data, 0, 1)
+	return results
+
+# Concatenate one field of all shards into a single .npy file
+def Consolidate(shards, name, filename):
+	lengths = []
+	for shard in shards:
+		with np.load(shard) as data:
+			lengths.append(data[name].shape[0])
+			shape = data[name].shape[1:]
+			dtype = data[name].dtype
+	tmp = filename + ".tmp.npy"
+	out = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(sum(lengths),) + shape)
+	start = 0
+	for (shard, length) in zip(shards, lengths):
+		with np.load(shard) as data:
+			out[start:start+length] = data[name]
+		start += length
+	out.flush()
+	del out
+	os.rename(tmp, filename)
@@ -0,0 +1,177 @@
+# Kyle Matsuda, Tanya Roussy, and Will Tobias
+#
+# Parameter sweeps for the TEBD simulations.
+#
+# Run_Sweep runs one simulation per sweep point, spread over a pool of
+# worker processes. Every point gets its own copies of the
+# model/sim/init/logs dicts and a deterministic output name
+# (<prefix>_<index>_<par>=<value>...), and the results of all points
+# are collected into one table indexed by sweep point, saved as
+# <prefix>_sweep.npz.
+#
+# Works with helpers.TEBD (tebd.py) and helpers_2species.TEBD (two_species.py).
+
+import numpy as np
+import copy
+import os
+import importlib
+import multiprocessing
+import cache
+import helpers
+
+# Copies of the parameter dicts with the swept parameters set to values
+# (a name that is in more than one of model, sim and init is ambiguous)
+def Point(model, sim, init, logs, sweep_par, values):
+	model = copy.deepcopy(model); sim = copy.deepcopy(sim)
+	init = copy.deepcopy(init); logs = copy.deepcopy(logs)
+	for j in range(0, len(sweep_par)):
+		if ([sweep_par[j] in params for params in [model, sim, init]].count(True) > 1):
+			raise ValueError("swept parameter {0} is in more than one of model, sim and init".format(sweep_par[j]))
+		if (sweep_par[j] in model):
+			model[sweep_par[j]] = values[j]
+		elif (sweep_par[j] in sim):
+			sim[sweep_par[j]] = values[j]
+		elif (sweep_par[j] in init):
+			init[sweep_par[j]] = values[j]
+	return model, sim, init, logs
+
+# Output name of sweep point i, e.g. "05_01_run_0003_U=2.2_J=1"
+def Point_Name(prefix, i, sweep_par, values):
+	name = "{0}_{1:04d}".format(prefix, i)
+	for j in range(0, len(sweep_par)):
+		try:
+			name += "_{0}={1:g}".format(sweep_par[j], float(values[j]))
+		except (TypeError, ValueError):
+			name += "_{0}={1}".format(sweep_par[j], values[j])
+	return name
+
+# Run a single sweep point; this is what the workers execute.
+# args = (module, model, sim, init, logs, fields, name, resume)
+# With sim['result_cache'], the point is taken from the cache (cache.py)
+# if it is there, and added to it otherwise.
+# Writes the parameters and the truncation error (and the energy drift, or
+# in imaginary time the energy and the number of iterations, and the profile
+# with sim['profile']) to <name>.txt and returns the truncation error and
+# the requested logged arrays.
+def Run_Point(args):
+	module, model, sim, init, logs, fields, name, resume = args
+	helpers = importlib.import_module(module)
+
+	# Everything this point writes is named after it
+	if (logs.get('out')):
+		logs['out'] = name + "_data"
+	if (sim.get('checkpoint')):
+		sim['checkpoint'] = name + ".ckpt"
+
+	simulation = helpers.TEBD(model, sim, init, logs)
+	# Start from the cache if it has this point (or a shorter run of it)
+	entry = None
+	if (cache.Enabled(module, model, sim, init, logs)):
+		entry = cache.Lookup(module, model, sim, init, logs)
+	if (entry is not None):
+		cache.Load(simulation, entry)
+	elif (resume and sim.get('checkpoint') and os.path.exists(sim['checkpoint'])):
+		simulation.Load_Checkpoint(sim['checkpoint'])
+	if (entry is not None and entry['N'] == sim['N']):
+		print "{0}: from the cache".format(name)
+	else:
+		if (entry is not None):
+			print "{0}: continuing the cached run from N = {1}".format(name, entry['N'])
+		simulation.Run_Simulation()
+		if (cache.Enabled(module, model, sim, init, logs)):
+			cache.Store(simulation, module)
+
+	Write_Point(name, model, sim, init, logs, simulation)
+
+	result = {'tau': simulation.tau}
+	for field in fields:
+		result[field] = getattr(simulation, field)
+	return result
+
+# Write the parameters and the results of a finished point to <name>.txt
+def Write_Point(name, model, sim, init, logs, simulation):
+	f = open(name + ".txt", 'w')
+	f.write("model = {0}\n".format(model))
+	f.write("sim = {0}\n".format(sim))
+	f.write("init = {0}\n".format(init))
+	f.write("logs = {0}\n".format(logs))
+	f.write("error = {0}".format(simulation.tau))
+	if (logs.get('E', False) and not sim.get('it', False)):
+		# Energy drift, a sign of too large a time step or too small chi
+		f.write("\nenergy = {0} -> {1}".format(simulation.E0, simulation.energy))
+	if (sim.get('it', False)):
+		f.write("\nenergy = {0}\n".format(simulation.energy))
+		f.write("iterations = {0}\n".format(simulation.iterations))
+		f.write("converged = {0}".format(simulation.converged))
+	if (getattr(simulation, 'profile', None) is not None):
+		f.write("\n\nprofile:\n" + simulation.profile.Report())
+	f.close()
+
+# Run every point of sweep_range (a list of value tuples for the
+# parameters named in sweep_par) with the TEBD class of module
+# ('helpers' or 'helpers_2species').
+# workers: number of processes (1 runs the points in this process),
+#	each with sim['blas_threads'] BLAS threads (see Point_Pool)
+# fields: logged arrays to collect from each point
+# resume: continue points from their checkpoints, if they have any
+# batch: evolve the points that share sim together (see batch.py),
+#	in up to workers processes (helpers only; these are not added
+#	to sim['result_cache'], but taken from it if they are there)
+# Returns the result table: 'params' (points x parameters), 'tau' (points)
+# and each field stacked along a new first axis, e.g. table['n_avg'][point, site, t].
+def Run_Sweep(module, model, sim, init, logs, sweep_par, sweep_range, prefix,
+		workers=1, fields=('a_avg', 'n_avg'), resume=False, batch=False):
+	jobs = []
+	for i in range(0, len(sweep_range)):
+		point = Point(model, sim, init, logs, sweep_par, sweep_range[i])
+		name = Point_Name(prefix, i, sweep_par, sweep_range[i])
+		jobs.append((module,) + point + (list(fields), name, resume))
+
+	if (batch):
+		import batch as batched
+		# Points the cache has are loaded from it, the rest run batched
+		cached = [i for i in range(0, len(jobs)) if cache.Complete(*jobs[i][0:5])]
+		batched_jobs = [jobs[i] for i in range(0, len(jobs)) if i not in cached]
+		pool = Point_Pool(workers, sim) if workers > 1 and len(batched_jobs) > 0 else None
+		try:
+			batched_results = batched.Run_Points(batched_jobs, pool)
+		finally:
+			if (pool is not None):
+				pool.close()
+				pool.join()
+		results = []
+		for i in range(0, len(jobs)):
+			if (i in cached):
+				results.append(Run_Point(jobs[i]))
+			else:
+				results.append(batched_results.pop(0))
+	elif (workers > 1):
+		pool = Point_Pool(workers, sim)
+		try:
+			results = pool.map(Run_Point, jobs, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		results = [Run_Point(job) for job in jobs]
+
+	# Collect everything into one table indexed by sweep point
+	table = {}
+	table['params'] = np.array(sweep_range, dtype=float)
+	table['tau'] = np.array([result['tau'] for result in results])
+	for field in fields:
+		table[field] = np.array([result[field] for result in results])
+	np.savez(prefix + "_sweep.npz", names=np.array(sweep_par), **table)
+	return table
+
+# Pool of worker processes running sweep points, with BLAS in each
+# limited to sim['blas_threads'] threads (one if that is None), so that
+# the workers do not each start a BLAS thread per core. Without
+# threadpoolctl that only works if the environment capped BLAS before
+# numpy was loaded (helpers.BLAS_Capped; run.py does), else it warns.
+def Point_Pool(workers, sim):
+	threads = sim.get('blas_threads')
+	if (threads is None):
+		threads = 1
+	helpers.Check_BLAS(threads)
+	return multiprocessing.Pool(workers, helpers.Limit_BLAS, (threads,))